@@ -0,0 +1,227 @@
+import os
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from agents.state import AgentState, add_trace
+from agents.rag_retrieve import get_engine
+
+CACHE_DIR = Path("data/cache")
+ANSWER_CACHE_PATH = CACHE_DIR / "answers.sqlite"
+
+SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+
+def is_enabled() -> bool:
+    # Eval runs must exercise the full pipeline, so the cache is off there
+    return os.getenv("ANSWER_CACHE", "1") == "1" and os.getenv("EVAL_MODE") != "1"
+
+
+def normalize_query(text: str) -> str:
+    text = " ".join((text or "").lower().split())
+    return re.sub(r"[\s?!.]+$", "", text)
+
+
+class AnswerCache:
+    """
+    Verified answers keyed by normalized question, top_k and index version.
+    Lookups try an exact match first, then cosine similarity over the
+    question embeddings stored for the current index version.
+    """
+
+    def __init__(self, path: Path = ANSWER_CACHE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "id INTEGER PRIMARY KEY, index_version TEXT, top_k INTEGER NOT NULL, "
+            "norm_query TEXT NOT NULL, task TEXT, final TEXT NOT NULL, notes TEXT NOT NULL, "
+            "embedding BLOB, created_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS answers_lookup ON answers (index_version, top_k, norm_query)"
+        )
+        self._lock = threading.Lock()
+        # Question embeddings per (index_version, top_k), dropped on every insert
+        self._matrices = {}
+
+    def lookup_exact(self, norm_query: str, top_k: int, index_version: str):
+        """Return the newest entry stored for exactly this question, or None."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT task, final, notes FROM answers "
+                "WHERE index_version IS ? AND top_k = ? AND norm_query = ? ORDER BY id DESC LIMIT 1",
+                (index_version, top_k, norm_query),
+            ).fetchone()
+        return _entry(row) if row else None
+
+    def _matrix(self, top_k: int, index_version: str):
+        """(ids, embeddings) for one index version and top_k; read from SQLite once per insert."""
+        key = (index_version, top_k)
+        if key not in self._matrices:
+            self._matrices = {k: v for k, v in self._matrices.items() if k[0] == index_version}
+            rows = self.conn.execute(
+                "SELECT id, embedding FROM answers "
+                "WHERE index_version IS ? AND top_k = ? AND embedding IS NOT NULL",
+                (index_version, top_k),
+            ).fetchall()
+            if rows:
+                ids = [row_id for row_id, _ in rows]
+                matrix = np.vstack([np.frombuffer(blob, dtype="float32") for _, blob in rows])
+            else:
+                ids, matrix = [], None
+            self._matrices[key] = (ids, matrix)
+        return self._matrices[key]
+
+    def lookup_similar(self, top_k: int, index_version: str, embedding):
+        """Return (entry, similarity) of the closest cached question, or (None, best_similarity)."""
+        with self._lock:
+            ids, matrix = self._matrix(top_k, index_version)
+            if matrix is None:
+                return None, None
+
+            sims = matrix @ embedding
+            best = int(np.argmax(sims))
+            similarity = round(float(sims[best]), 4)
+            if similarity < SIMILARITY_THRESHOLD:
+                return None, similarity
+
+            row = self.conn.execute(
+                "SELECT task, final, notes FROM answers WHERE id = ?", (ids[best],)
+            ).fetchone()
+        return (_entry(row), similarity) if row else (None, similarity)
+
+    def store(self, norm_query: str, top_k: int, index_version: str, task: str, final: str, notes, embedding=None):
+        blob = None if embedding is None else np.ascontiguousarray(embedding, dtype="float32").tobytes()
+        with self._lock:
+            # Answers grounded in an older index are no longer valid
+            self.conn.execute("DELETE FROM answers WHERE index_version IS NOT ?", (index_version,))
+            self.conn.execute(
+                "INSERT INTO answers (index_version, top_k, norm_query, task, final, notes, embedding, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (index_version, top_k, norm_query, task, final, json.dumps(notes, ensure_ascii=False), blob, time.time()),
+            )
+            self.conn.execute(
+                "DELETE FROM answers WHERE id NOT IN (SELECT id FROM answers ORDER BY id DESC LIMIT ?)",
+                (MAX_ENTRIES,),
+            )
+            self.conn.commit()
+            self._matrices = {}
+
+
+def _entry(row):
+    task, final, notes = row
+    return {"task": task, "final": final, "notes": json.loads(notes)}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache()
+    return _cache
+
+
+def _embed_query(engine, text: str):
+    emb = engine.model.encode([text], convert_to_numpy=True).astype("float32")
+    faiss.normalize_L2(emb)
+    return emb[0]
+
+
+def run(state: AgentState) -> AgentState:
+    """Graph node: answer from the cache when possible, otherwise continue."""
+    if not is_enabled():
+        state["answer_cache"] = {"status": "disabled"}
+        return state
+
+    t0 = time.perf_counter()
+    task = state.get("task", "")
+    top_k = int(state.get("top_k", 5))
+    norm_query = normalize_query(task)
+
+    try:
+        engine = get_engine().load()
+    except FileNotFoundError:
+        # No index yet: let the retriever report it
+        state["answer_cache"] = {"status": "miss"}
+        return state
+    index_version = engine.index_version
+
+    cache = get_answer_cache()
+    entry, kind, similarity = cache.lookup_exact(norm_query, top_k, index_version), "hit_exact", 1.0
+    if entry is None:
+        # Only an exact miss pays for the encode; maybe_store() reuses the vector
+        state["query_embedding"] = _embed_query(engine, task)
+        entry, similarity = cache.lookup_similar(top_k, index_version, state["query_embedding"])
+        kind = "miss" if entry is None else "hit_semantic"
+    lookup_ms = round((time.perf_counter() - t0) * 1000, 2)
+
+    state["answer_cache"] = {
+        "status": kind,
+        "similarity": similarity,
+        "lookup_ms": lookup_ms,
+        "index_version": index_version,
+    }
+
+    if entry is None:
+        add_trace(state, "answer_cache", "miss", "No cached answer for this question",
+                  meta={"best_similarity": similarity, "lookup_ms": lookup_ms})
+        return state
+
+    state["final"] = entry["final"]
+    state["notes"] = entry["notes"]
+    add_trace(
+        state,
+        "answer_cache",
+        kind,
+        "Served verified answer from cache",
+        meta={"cached_task": entry["task"], "similarity": similarity, "lookup_ms": lookup_ms},
+    )
+    return state
+
+
+def is_hit(state: AgentState) -> bool:
+    return str((state.get("answer_cache") or {}).get("status", "")).startswith("hit")
+
+
+def maybe_store(state: AgentState) -> None:
+    """Cache the answer if the verifier finalized it in this run."""
+    info = state.get("answer_cache") or {}
+    if not is_enabled() or is_hit(state) or info.get("status") != "miss" or "index_version" not in info:
+        return
+    if state.get("stop") or state.get("needs_clarification"):
+        return
+
+    finalized = any(
+        e.get("agent") == "verifier" and e.get("action") == "finalized"
+        for e in (state.get("trace") or [])
+    )
+    if not finalized or not state.get("final"):
+        return
+
+    task = state.get("task", "")
+    embedding = state.get("query_embedding")
+    if embedding is None:
+        embedding = _embed_query(get_engine().load(), task)
+    get_answer_cache().store(
+        normalize_query(task),
+        int(state.get("top_k", 5)),
+        info["index_version"],
+        task,
+        state["final"],
+        state.get("notes", []),
+        embedding,
+    )
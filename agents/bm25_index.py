@@ -0,0 +1,216 @@
+import os
+import re
+import json
+from array import array
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+INDEX_DIR = Path("data/index")
+BM25_PATH = INDEX_DIR / "bm25.npz"
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Only the most frequent function words and question words; their postings
+# would cover every chunk and they would dilute query coverage
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how in is it its of on or that the their this to"
+    " was were what when where which who why with"
+    .split()
+)
+
+
+def tokenize(text: str):
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over chunk text in CSR layout: postings of term t are
+    positions indptr[t]:indptr[t+1] of the flat `docs` / `tfs` arrays.
+    Raw term frequencies and document lengths are kept so chunks can be
+    added and removed without re-tokenizing the corpus; the tf and length
+    normalisation is folded into `weights` whenever the postings change,
+    so a query is one idf-scaled scatter-add per query term.
+    """
+
+    def __init__(self, terms, indptr, docs, tfs, doc_ids, doc_len, version=None):
+        self.terms = terms
+        self.vocab = {t: i for i, t in enumerate(terms)}
+        self.indptr = indptr
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_ids = doc_ids
+        self.doc_len = doc_len
+        self.version = version
+        self._weigh()
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.doc_ids)
+
+    def _weigh(self) -> None:
+        n = self.n_docs
+        lengths = self.doc_len.astype(np.float32)
+        avgdl = float(lengths.mean()) if n else 0.0
+        tfs = self.tfs.astype(np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[self.docs] / max(avgdl, 1e-9))
+        self.weights = (tfs * (BM25_K1 + 1) / (tfs + norm)).astype(np.float32)
+
+        df = np.diff(self.indptr).astype(np.float64)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    # -----------------------------------------------------------------
+    # Build / update / persist
+    # -----------------------------------------------------------------
+
+    @staticmethod
+    def _tokenize_rows(rows, vocab: dict, first_doc: int):
+        """Postings (term, doc, tf) of rows, numbering docs from first_doc and growing vocab."""
+        doc_ids, doc_len = array("q"), array("i")
+        p_term, p_doc, p_tf = array("i"), array("i"), array("i")
+        for row in rows:
+            tokens = tokenize(row["text"])
+            doc = first_doc + len(doc_ids)
+            doc_ids.append(int(row["id"]))
+            doc_len.append(len(tokens))
+            for tok, tf in Counter(tokens).items():
+                p_term.append(vocab.setdefault(tok, len(vocab)))
+                p_doc.append(doc)
+                p_tf.append(tf)
+        return (
+            np.frombuffer(doc_ids, dtype=np.int64), np.frombuffer(doc_len, dtype=np.int32),
+            np.frombuffer(p_term, dtype=np.int32), np.frombuffer(p_doc, dtype=np.int32),
+            np.frombuffer(p_tf, dtype=np.int32),
+        )
+
+    @classmethod
+    def _from_postings(cls, terms, p_term, p_doc, p_tf, doc_ids, doc_len, version) -> "BM25Index":
+        # Terms left without postings (all their chunks removed) are dropped
+        counts = np.bincount(p_term, minlength=len(terms))
+        live = np.flatnonzero(counts)
+        if len(live) < len(terms):
+            remap = np.full(len(terms), -1, dtype=np.int32)
+            remap[live] = np.arange(len(live), dtype=np.int32)
+            p_term, counts = remap[p_term], counts[live]
+            terms = [terms[t] for t in live]
+
+        order = np.argsort(p_term, kind="stable")  # stable keeps docs ascending within a term
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(terms, indptr, p_doc[order].astype(np.int32), p_tf[order].astype(np.int32),
+                   doc_ids.astype(np.int64), doc_len.astype(np.int32), version)
+
+    @classmethod
+    def build(cls, rows, version=None) -> "BM25Index":
+        """Build from chunk store rows ({"id", "text", ...})."""
+        vocab = {}
+        doc_ids, doc_len, p_term, p_doc, p_tf = cls._tokenize_rows(rows, vocab, 0)
+        return cls._from_postings(list(vocab), p_term, p_doc, p_tf, doc_ids, doc_len, version)
+
+    def update(self, removed_ids, rows, version=None) -> "BM25Index":
+        """
+        Return a new index without the chunks in removed_ids and with rows
+        added. Only the added rows are tokenized; existing postings are
+        filtered and re-sorted as arrays.
+        """
+        keep = ~np.isin(self.doc_ids, np.asarray(list(removed_ids), dtype=np.int64))
+        new_pos = np.cumsum(keep) - 1
+
+        p_term = np.repeat(np.arange(len(self.terms), dtype=np.int32), np.diff(self.indptr))
+        kept = keep[self.docs]
+        vocab = dict(self.vocab)
+        doc_ids, doc_len, a_term, a_doc, a_tf = self._tokenize_rows(rows, vocab, int(keep.sum()))
+
+        return self._from_postings(
+            list(vocab),
+            np.concatenate([p_term[kept], a_term]),
+            np.concatenate([new_pos[self.docs[kept]].astype(np.int32), a_doc]),
+            np.concatenate([self.tfs[kept], a_tf]),
+            np.concatenate([self.doc_ids[keep], doc_ids]),
+            np.concatenate([self.doc_len[keep], doc_len]),
+            version,
+        )
+
+    def save(self, path: Path = BM25_PATH) -> None:
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        # \w+ tokens never contain "\n", so the vocabulary is one utf-8 blob
+        terms = np.frombuffer("\n".join(self.terms).encode("utf-8"), dtype=np.uint8)
+        meta = json.dumps({"version": self.version, "k1": BM25_K1, "b": BM25_B})
+        with open(tmp, "wb") as f:
+            np.savez(f, terms=terms, indptr=self.indptr, docs=self.docs, tfs=self.tfs,
+                     doc_ids=self.doc_ids, doc_len=self.doc_len, meta=np.array(meta))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path = BM25_PATH) -> "BM25Index":
+        with np.load(path) as z:
+            if "tfs" not in z.files:
+                raise ValueError(f"{path} predates incremental BM25 updates; re-run ingest")
+            blob = z["terms"].tobytes().decode("utf-8")
+            meta = json.loads(str(z["meta"]))
+            return cls(
+                blob.split("\n") if blob else [],
+                z["indptr"], z["docs"], z["tfs"], z["doc_ids"], z["doc_len"],
+                meta.get("version"),
+            )
+
+    # -----------------------------------------------------------------
+    # Query
+    # -----------------------------------------------------------------
+
+    def search(self, query: str, k: int):
+        """
+        Return (chunk_ids, scores, coverage) of the k best-scoring chunks,
+        best first. coverage is the idf-weighted share of the query's terms
+        that occur in the chunk (terms missing from the corpus count with
+        the highest possible idf), so a chunk that only shares a common word
+        with an off-topic question stays near 0 whatever its raw score.
+        """
+        empty = np.empty(0, dtype=np.float32)
+        query_terms = set(tokenize(query))
+        term_ids = {self.vocab[t] for t in query_terms if t in self.vocab}
+        if not term_ids or k <= 0:
+            return np.empty(0, dtype=np.int64), empty, empty
+
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        matched = np.zeros(self.n_docs, dtype=np.float32)
+        for t in term_ids:
+            lo, hi = self.indptr[t], self.indptr[t + 1]
+            # A document occurs once per term's postings, so plain fancy-index += is safe
+            scores[self.docs[lo:hi]] += self.idf[t] * self.weights[lo:hi]
+            matched[self.docs[lo:hi]] += self.idf[t]
+
+        unseen_idf = float(np.log1p((self.n_docs + 0.5) / 0.5))  # idf of a term with df = 0
+        total_idf = float(sum(self.idf[t] for t in term_ids)) + unseen_idf * (len(query_terms) - len(term_ids))
+
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return self.doc_ids[hits], scores[hits], matched[hits] / max(total_idf, 1e-9)
+
+
+def build_bm25(rows, version=None, path: Path = BM25_PATH) -> BM25Index:
+    """Build the BM25 index from chunk rows and write it next to the FAISS index."""
+    index = BM25Index.build(rows, version)
+    index.save(path)
+    return index
+
+
+def load_bm25(version=None, path: Path = BM25_PATH):
+    """Return the saved index, or None if it is missing, outdated or belongs to another index version."""
+    if not Path(path).exists():
+        return None
+    try:
+        index = BM25Index.load(path)
+    except ValueError:
+        return None
+    if version is not None and index.version != version:
+        return None
+    return index
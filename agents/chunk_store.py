@@ -0,0 +1,69 @@
+import sqlite3
+import threading
+from pathlib import Path
+
+INDEX_DIR = Path("data/index")
+STORE_PATH = INDEX_DIR / "chunks.sqlite"
+
+_COLUMNS = ("id", "source_file", "page", "chunk_in_page", "text")
+
+
+class ChunkStore:
+    """
+    Chunk text and citation fields keyed by chunk id (the FAISS id).
+    Lookups go through the primary key, so fetching top_k rows is O(k)
+    and nothing is loaded up front.
+    """
+
+    def __init__(self, path: Path = STORE_PATH, readonly: bool = False):
+        self.path = Path(path)
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "id INTEGER PRIMARY KEY, source_file TEXT NOT NULL, page INTEGER NOT NULL, "
+                "chunk_in_page INTEGER NOT NULL, text TEXT NOT NULL)"
+            )
+        self._lock = threading.Lock()
+
+    def add_rows(self, rows) -> None:
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?)",
+                [tuple(r[c] for c in _COLUMNS) for r in rows],
+            )
+
+    def delete_ids(self, ids) -> None:
+        with self._lock:
+            self.conn.executemany("DELETE FROM chunks WHERE id = ?", [(int(i),) for i in ids])
+
+    def get(self, ids) -> dict:
+        """Return {id: row} for the given ids (missing ids are skipped)."""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            cur = self.conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM chunks WHERE id IN ({placeholders})", ids
+            )
+            return {row[0]: dict(zip(_COLUMNS, row)) for row in cur}
+
+    def iter_rows(self):
+        # Separate cursor; rows are streamed, not fetched all at once
+        cur = self.conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM chunks ORDER BY id")
+        for row in cur:
+            yield dict(zip(_COLUMNS, row))
+
+    def count(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def commit(self) -> None:
+        with self._lock:
+            self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,68 @@
+import hashlib
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+
+CACHE_DIR = Path("data/cache")
+EMBED_CACHE_PATH = CACHE_DIR / "embeddings.sqlite"
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk cache of normalized float32 chunk embeddings keyed by
+    (model name, sha256 of chunk text). Lives outside data/index so it
+    survives --rebuild and index-type changes.
+    """
+
+    def __init__(self, model_name: str, path: Path = EMBED_CACHE_PATH):
+        self.model_name = model_name
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, sha TEXT NOT NULL, dim INTEGER NOT NULL, vec BLOB NOT NULL, "
+            "PRIMARY KEY (model, sha))"
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, texts):
+        """Return a list with a vector (or None on a miss) per text."""
+        keys = [text_hash(t) for t in texts]
+        found = {}
+        unique = list(set(keys))
+        for i in range(0, len(unique), 500):  # stay under SQLite's variable limit
+            part = unique[i:i + 500]
+            cur = self.conn.execute(
+                f"SELECT sha, vec FROM embeddings WHERE model = ? AND sha IN ({','.join('?' * len(part))})",
+                [self.model_name, *part],
+            )
+            for sha, blob in cur:
+                found[sha] = np.frombuffer(blob, dtype="float32")
+
+        out = [found.get(k) for k in keys]
+        hit = sum(v is not None for v in out)
+        self.hits += hit
+        self.misses += len(out) - hit
+        return out
+
+    def put_many(self, texts, vectors) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+            [(self.model_name, text_hash(t), v.shape[0], v.tobytes()) for t, v in zip(texts, vectors)],
+        )
+        self.conn.commit()
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def close(self) -> None:
+        self.conn.close()
@@ -2,15 +2,23 @@ from langgraph.graph import StateGraph, END
 
 from agents.state import AgentState, add_trace
 from agents.planner_agent import run as planner_run
-from agents.retriever_agent import run as retriever_run
-from agents.writer_agent import run as writer_run
-from agents.verifier_agent import run as verifier_run
+from agents.retriever_agent import run as retriever_run, arun as retriever_arun
+from agents.writer_agent import run as writer_run, arun as writer_arun, run_stream as writer_run_stream
+from agents.verifier_agent import run as verifier_run, arun as verifier_arun
 
 from agents.persistence import save_run
 from agents.guardrails_agent import run as guardrails_run
+from agents.rag_retrieve import get_engine
+from agents.timing import span
+from agents import answer_cache, metrics, reranker, speculation
 
+import asyncio
+import threading
 import time
 
+_apps = {}
+_app_lock = threading.Lock()
+
 
 def planner_node(state: AgentState) -> AgentState:
     return planner_run(state)
@@ -21,6 +29,9 @@ def retriever_node(state: AgentState) -> AgentState:
 
 
 def writer_node(state: AgentState) -> AgentState:
+    speculation.start(state)
+    if state.get("stream"):
+        return writer_run_stream(state)
     return writer_run(state)
 
 
@@ -32,9 +43,52 @@ def guardrails_node(state: AgentState) -> AgentState:
     return guardrails_run(state)
 
 
+def answer_cache_node(state: AgentState) -> AgentState:
+    return answer_cache.run(state)
+
+
+# --- Async nodes (network calls awaited, CPU work in worker threads) ---
+
+async def retriever_node_async(state: AgentState) -> AgentState:
+    return await retriever_arun(state)
+
+
+async def writer_node_async(state: AgentState) -> AgentState:
+    speculation.astart(state)
+    return await writer_arun(state)
+
+
+async def verifier_node_async(state: AgentState) -> AgentState:
+    return await verifier_arun(state)
+
+
+async def answer_cache_node_async(state: AgentState) -> AgentState:
+    # Query embedding + SQLite lookup
+    return await asyncio.to_thread(answer_cache.run, state)
+
+
+def _timed(name: str, fn):
+    """Wrap a node in a timing span (see agents.timing.span)."""
+    if asyncio.iscoroutinefunction(fn):
+        async def timed_node(state: AgentState) -> AgentState:
+            with span(state, name):
+                out = await fn(state)
+            return out
+    else:
+        def timed_node(state: AgentState) -> AgentState:
+            with span(state, name):
+                out = fn(state)
+            return out
+    return timed_node
+
+
 def _route_after_guardrails(state: AgentState):
     # If guardrails blocked the request, end immediately
-    return END if state.get("stop") else "planner"
+    return END if state.get("stop") else "answer_cache"
+
+
+def _route_after_answer_cache(state: AgentState):
+    return END if answer_cache.is_hit(state) else "planner"
 
 
 def _route_after_verifier(state: AgentState):
@@ -45,19 +99,24 @@ def _route_after_retriever(state: AgentState):
     return END if state.get("stop") else "writer"
 
 
-def build_graph():
+def build_graph(async_mode: bool = False):
     graph = StateGraph(AgentState)
 
-    graph.add_node("guardrails", guardrails_node)
-    graph.add_node("planner", planner_node)
-    graph.add_node("retriever", retriever_node)
-    graph.add_node("writer", writer_node)
-    graph.add_node("verifier", verifier_node)
+    # Guardrails and planner are pure CPU and cheap; they stay sync in both modes
+    graph.add_node("guardrails", _timed("guardrails", guardrails_node))
+    graph.add_node("answer_cache", _timed("answer_cache", answer_cache_node_async if async_mode else answer_cache_node))
+    graph.add_node("planner", _timed("planner", planner_node))
+    graph.add_node("retriever", _timed("retriever", retriever_node_async if async_mode else retriever_node))
+    graph.add_node("writer", _timed("writer", writer_node_async if async_mode else writer_node))
+    graph.add_node("verifier", _timed("verifier", verifier_node_async if async_mode else verifier_node))
 
     graph.set_entry_point("guardrails")
 
     # Guardrails decides whether we continue or stop
-    graph.add_conditional_edges("guardrails", _route_after_guardrails, ["planner", END])
+    graph.add_conditional_edges("guardrails", _route_after_guardrails, ["answer_cache", END])
+
+    # Cached verified answers skip the rest of the pipeline
+    graph.add_conditional_edges("answer_cache", _route_after_answer_cache, ["planner", END])
 
     graph.add_edge("planner", "retriever")
     graph.add_conditional_edges("retriever", _route_after_retriever, ["writer", END])
@@ -69,22 +128,109 @@ def build_graph():
     return graph.compile()
 
 
-def run(task: str, top_k: int = 5) -> AgentState:
-    app = build_graph()
+def get_graph(async_mode: bool = False):
+    """Compiled graph shared by every run in this process."""
+    app = _apps.get(async_mode)
+    if app is None:
+        with _app_lock:
+            app = _apps.get(async_mode)
+            if app is None:
+                app = _apps[async_mode] = build_graph(async_mode)
+    return app
+
+
+def warm_up() -> dict:
+    """Pre-compile the graph, preload retrieval resources and start the metrics endpoint."""
+    metrics.start_from_env()
+    t0 = time.perf_counter()
+    get_graph()
+    get_graph(async_mode=True)
+    compile_ms = round((time.perf_counter() - t0) * 1000, 2)
+
+    try:
+        engine = get_engine().load()
+        index_load_ms = engine.load_ms
+    except FileNotFoundError:
+        # No index yet; the first retrieval will report it.
+        index_load_ms = None
+
+    rerank_load_ms = None
+    if reranker.is_enabled():
+        rerank_load_ms = reranker.get_reranker().load().load_ms
+
+    return {"graph_compile_ms": compile_ms, "index_load_ms": index_load_ms, "rerank_load_ms": rerank_load_ms}
+
+
+def _initial_state(task: str, top_k: int) -> AgentState:
     state: AgentState = {
         "task": task,
         "top_k": top_k,
         "trace": [],
         "retried": False,
         "needs_retry": False,
-        "tool_allowlist": ["retriever"]
+        "tool_allowlist": ["retriever"],
+        "run_start": time.perf_counter(),
     }
-
     add_trace(state, "system", "start", "Starting LangGraph run")
-    t0 = time.perf_counter()
-    out = app.invoke(state)
-    latency_ms = round((time.perf_counter() - t0) * 1000, 2)
+    return state
+
+
+def _finish(out: AgentState, latency_ms: float) -> AgentState:
     out["latency_ms"] = latency_ms
     add_trace(out, "system", "end", "Finished LangGraph run")
+    answer_cache.maybe_store(out)
+    metrics.record_run(out)
     save_run(out)
     return out
+
+
+def run(task: str, top_k: int = 5) -> AgentState:
+    app = get_graph()
+    state = _initial_state(task, top_k)
+    t0 = time.perf_counter()
+    out = app.invoke(state)
+    latency_ms = round((time.perf_counter() - t0) * 1000, 2)
+    return _finish(out, latency_ms)
+
+
+async def arun(task: str, top_k: int = 5) -> AgentState:
+    """
+    Async entry point: LLM calls are awaited on the event loop and
+    embedding/FAISS/SQLite work runs in worker threads, so many questions
+    can be in flight in one process.
+    """
+    app = get_graph(async_mode=True)
+    state = _initial_state(task, top_k)
+    t0 = time.perf_counter()
+    out = await app.ainvoke(state)
+    latency_ms = round((time.perf_counter() - t0) * 1000, 2)
+    # cache store and log write touch disk
+    return await asyncio.to_thread(_finish, out, latency_ms)
+
+
+def run_stream(task: str, top_k: int = 5):
+    """
+    Streaming entry point. Yields events while the graph runs:
+      {"type": "token", "text": ...}        writer output as it arrives
+      {"type": "retry", "new_query": ...}   verifier rejected the draft shown so far
+    and finally {"type": "final", "state": ...} with the logged run state.
+    Time to first token is recorded as ttft_ms next to latency_ms.
+    """
+    app = get_graph()
+    state = _initial_state(task, top_k)
+    state["stream"] = True
+    t0 = time.perf_counter()
+    ttft_ms = None
+    out = state
+
+    for mode, chunk in app.stream(state, stream_mode=["custom", "values"]):
+        if mode == "values":
+            out = chunk
+            continue
+        if chunk.get("type") == "token" and ttft_ms is None:
+            ttft_ms = round((time.perf_counter() - t0) * 1000, 2)
+        yield chunk
+
+    latency_ms = round((time.perf_counter() - t0) * 1000, 2)
+    out["ttft_ms"] = ttft_ms
+    yield {"type": "final", "state": _finish(out, latency_ms)}
@@ -1,5 +1,17 @@
+import os
 import re
+import json
+import threading
+import time
+from pathlib import Path
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
 from agents.state import AgentState, add_trace
+from agents.metrics import REGISTRY
 
 INJECTION_PATTERNS = [
     r"ignore( all| previous)? instructions",
@@ -38,22 +50,158 @@ OVERRIDE_PATTERNS = [
 
 BLOCK_PATTERNS = HARMFUL_PATTERNS + OVERRIDE_PATTERNS + INJECTION_PATTERNS
 
+BUILTIN_PACKS = {
+    "harmful": HARMFUL_PATTERNS,
+    "override": OVERRIDE_PATTERNS,
+    "injection": INJECTION_PATTERNS,
+}
+
+# Optional JSON rule packs: {"category": ["pattern", ...], ...}. A category
+# with a built-in name replaces that pack; new categories are added.
+RULES_PATH = Path(os.getenv("GUARDRAIL_RULES", "data/guardrail_rules.json"))
+RELOAD_CHECK_SECONDS = 2.0
+
+
+def required_literal(pattern: str) -> str:
+    """
+    Longest literal run that every match of `pattern` must contain ("" if
+    none can be derived, e.g. for top-level alternations).
+    """
+    best, run = "", ""
+    for op, arg in sre_parse.parse(pattern):
+        if op is sre_parse.LITERAL:
+            run += chr(arg)
+            continue
+        if op is sre_parse.AT:
+            continue  # \b etc. are zero-width; the literal run stays contiguous
+        best = max(best, run, key=len)
+        run = ""
+    return max(best, run, key=len)
+
+
+class RuleEngine:
+    """
+    Block patterns compiled once at load time. Each rule's required literal
+    is checked with a plain substring test first and only rules whose
+    literal occurs in the input are confirmed with their regex, so clean
+    inputs cost a few C-level substring scans instead of one regex search
+    per rule.
+    """
+
+    def __init__(self, packs: dict):
+        self.rules = []
+        for category, patterns in packs.items():
+            for p in patterns:
+                self.rules.append((f"{category}:{p}", category, re.compile(p)))
+
+        # (rule index, required literal); "" means the regex always runs
+        self._checks = []
+        for i, (_, _, rx) in enumerate(self.rules):
+            # Inputs are lowercased; a case-insensitive rule's literal may not be
+            literal = "" if rx.flags & re.IGNORECASE else required_literal(rx.pattern)
+            self._checks.append((i, literal))
+
+        self.hits = {rule_id: 0 for rule_id, _, _ in self.rules}
+        self._lock = threading.Lock()
+
+    def match(self, text: str):
+        """Return (rule_id, category) of the first matching rule, or None."""
+        hit = None
+        for i, literal in self._checks:
+            if literal in text and self.rules[i][2].search(text):
+                hit = i
+                break
+        if hit is None:
+            return None
+
+        rule_id, category, _ = self.rules[hit]
+        with self._lock:
+            self.hits[rule_id] += 1
+        return rule_id, category
+
+
+def _load_packs() -> dict:
+    packs = dict(BUILTIN_PACKS)
+    if RULES_PATH.exists():
+        data = json.loads(RULES_PATH.read_text(encoding="utf-8"))
+        if not isinstance(data, dict):
+            raise ValueError(f"expected an object of category -> [pattern, ...], got {type(data).__name__}")
+        for category, patterns in data.items():
+            # A bare string would become one rule per character; "" matches everything
+            if not isinstance(patterns, list) or not all(isinstance(p, str) and p for p in patterns):
+                print(f"Guardrail pack {category!r} in {RULES_PATH} skipped: expected a list of non-empty strings")
+                continue
+            packs[category] = list(patterns)
+    return packs
+
+
+_engine = None
+_engine_mtime = None
+_last_check = 0.0
+_engine_lock = threading.Lock()
+
+
+def _rules_mtime():
+    try:
+        return RULES_PATH.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def get_rule_engine() -> RuleEngine:
+    """Shared engine; rebuilt when the rules file changes (checked every few seconds)."""
+    global _engine, _engine_mtime, _last_check
+    now = time.monotonic()
+    if _engine is not None and now - _last_check < RELOAD_CHECK_SECONDS:
+        return _engine
+
+    with _engine_lock:
+        _last_check = now
+        mtime = _rules_mtime()
+        if _engine is not None and mtime == _engine_mtime:
+            return _engine
+        try:
+            engine = RuleEngine(_load_packs())
+        except (ValueError, TypeError, AttributeError, re.error) as e:
+            _engine_mtime = mtime
+            if _engine is not None:
+                # Keep serving the last good rules
+                print(f"Guardrail rules not reloaded from {RULES_PATH}: {e}")
+                return _engine
+            print(f"Guardrail rules in {RULES_PATH} not loaded, using the built-in packs: {e}")
+            engine = RuleEngine(BUILTIN_PACKS)
+        if _engine is not None:
+            for rule_id, n in _engine.hits.items():
+                if rule_id in engine.hits:
+                    engine.hits[rule_id] = n
+        _engine, _engine_mtime = engine, mtime
+    return _engine
+
 
 def run(state: AgentState) -> AgentState:
     task = (state.get("task") or "").strip()
     lower = task.lower()
 
-    add_trace(state, "guardrails", "check", "Checked input for safety")
+    engine = get_rule_engine()
+    t0 = time.perf_counter()
+    hit = engine.match(lower)
+    match_ms = round((time.perf_counter() - t0) * 1000, 3)
+
+    add_trace(state, "guardrails", "check", "Checked input for safety",
+              meta={"rules": len(engine.rules), "match_ms": match_ms})
 
     if len(task) > 4000:
         task = task[:4000]
         state["task"] = task
         add_trace(state, "guardrails", "truncate_input", "Truncated task to 4000 chars")
 
-    if any(re.search(p, lower) for p in BLOCK_PATTERNS):
+    if hit is not None:
+        rule_id, category = hit
+        REGISTRY.inc("rag_guardrail_hits_total", category=category)
         state["final"] = "Not found in the sources."
         state["stop"] = True
-        add_trace(state, "guardrails", "blocked", "Blocked unsafe/override request")
+        add_trace(state, "guardrails", "blocked", "Blocked unsafe/override request",
+                  meta={"rule": rule_id, "category": category, "rule_hits": engine.hits[rule_id]})
         return state
 
     state.pop("stop", None)
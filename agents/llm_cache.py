@@ -0,0 +1,210 @@
+import os
+import json
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from agents.metrics import record_llm
+from agents.state import AgentState
+
+CACHE_DIR = Path("data/cache")
+LLM_CACHE_PATH = CACHE_DIR / "llm.sqlite"
+
+TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000"))
+
+
+def is_enabled() -> bool:
+    return os.getenv("LLM_CACHE", "1") == "1"
+
+
+def cache_key(model: str, temperature: float, system: str, user: str) -> str:
+    payload = json.dumps([model, float(temperature), system, user], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """Chat completions keyed by hash(model, temperature, system, user), with TTL and LRU eviction."""
+
+    def __init__(self, path: Path = LLM_CACHE_PATH, ttl_seconds: int = TTL_SECONDS, max_entries: int = MAX_ENTRIES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, model TEXT, content TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)")
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT content, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            content, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self.conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            return content
+
+    def put(self, key: str, model: str, content: str) -> None:
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?)",
+                (key, model, content, now, now),
+            )
+            self.conn.execute("DELETE FROM completions WHERE created_at < ?", (now - self.ttl_seconds,))
+            self.conn.execute(
+                "DELETE FROM completions WHERE key NOT IN "
+                "(SELECT key FROM completions ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self.conn.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_completion_cache() -> CompletionCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CompletionCache()
+    return _cache
+
+
+def _count(state: AgentState, node: str, hit: bool) -> None:
+    counters = state.setdefault("llm_cache", {}).setdefault(node, {"hits": 0, "misses": 0})
+    counters["hits" if hit else "misses"] += 1
+
+
+def _messages(system: str, user: str):
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ]
+
+
+def complete(state: AgentState, node: str, client, model: str, temperature: float, system: str, user: str) -> str:
+    """
+    Return the assistant message for (system, user), served from the
+    completion cache when possible. Hits/misses are counted per node in
+    state["llm_cache"].
+    """
+    key = cache_key(model, temperature, system, user) if is_enabled() else None
+    if key is not None:
+        cached = get_completion_cache().get(key)
+        if cached is not None:
+            _count(state, node, hit=True)
+            record_llm(node, cache_hit=True)
+            return cached
+
+    resp = client.chat.completions.create(
+        model=model,
+        messages=_messages(system, user),
+        temperature=temperature,
+    )
+    content = resp.choices[0].message.content or ""
+    record_llm(node, cache_hit=False, usage=getattr(resp, "usage", None))
+
+    if key is not None:
+        _count(state, node, hit=False)
+        if content.strip():
+            get_completion_cache().put(key, model, content)
+    return content
+
+
+async def acomplete(state: AgentState, node: str, aclient, model: str, temperature: float, system: str, user: str) -> str:
+    """Async variant of complete() for an AsyncOpenAI client; SQLite access runs in a thread."""
+    key = cache_key(model, temperature, system, user) if is_enabled() else None
+    if key is not None:
+        cached = await asyncio.to_thread(get_completion_cache().get, key)
+        if cached is not None:
+            _count(state, node, hit=True)
+            record_llm(node, cache_hit=True)
+            return cached
+
+    resp = await aclient.chat.completions.create(
+        model=model,
+        messages=_messages(system, user),
+        temperature=temperature,
+    )
+    content = resp.choices[0].message.content or ""
+    record_llm(node, cache_hit=False, usage=getattr(resp, "usage", None))
+
+    if key is not None:
+        _count(state, node, hit=False)
+        if content.strip():
+            await asyncio.to_thread(get_completion_cache().put, key, model, content)
+    return content
+
+
+def stream_complete(state: AgentState, node: str, client, model: str, temperature: float, system: str, user: str):
+    """
+    Generator variant of complete(): yields content deltas as they arrive.
+    A cache hit is yielded as a single piece; a miss is cached once the
+    stream has finished. Closing the generator early aborts the request.
+    """
+    key = cache_key(model, temperature, system, user) if is_enabled() else None
+    if key is not None:
+        cached = get_completion_cache().get(key)
+        if cached is not None:
+            _count(state, node, hit=True)
+            record_llm(node, cache_hit=True)
+            yield cached
+            return
+
+    stream = client.chat.completions.create(
+        model=model,
+        messages=_messages(system, user),
+        temperature=temperature,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    parts = []
+    usage = None
+    finished = False
+    try:
+        for chunk in stream:
+            # With include_usage the last chunk carries usage and no choices
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+        finished = True
+    finally:
+        if not finished:
+            # The caller stopped reading (e.g. the draft was already rejected): end the HTTP stream
+            stream.close()
+        record_llm(node, cache_hit=False, usage=usage)
+        if key is not None:
+            _count(state, node, hit=False)
+
+    # A partial completion is never cached
+    content = "".join(parts)
+    if key is not None and content.strip():
+        get_completion_cache().put(key, model, content)
+
+
+def node_counters(state: AgentState, node: str) -> dict:
+    """Counters for one node, for trace meta."""
+    return dict((state.get("llm_cache") or {}).get(node, {}))
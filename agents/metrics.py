@@ -0,0 +1,217 @@
+import os
+import atexit
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from agents.state import AgentState
+
+# Seconds; covers cache hits (ms) up to slow LLM calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRICS = {
+    "rag_runs_total": ("counter", "Completed graph runs"),
+    "rag_runs_blocked_total": ("counter", "Runs blocked by guardrails"),
+    "rag_runs_retried_total": ("counter", "Runs where the verifier requested a retry"),
+    "rag_runs_no_evidence_total": ("counter", "Runs stopped by the retriever for lack of evidence"),
+    "rag_answer_cache_total": ("counter", "Answer cache lookups by status"),
+    "rag_guardrail_hits_total": ("counter", "Requests blocked by guardrails, by rule category"),
+    "rag_llm_requests_total": ("counter", "LLM completions by node and completion cache result"),
+    "rag_llm_tokens_total": ("counter", "LLM tokens by node and kind (prompt/completion)"),
+    "rag_speculation_total": ("counter", "Speculative query rewrites by outcome (used/discarded/failed)"),
+    "rag_run_latency_seconds": ("histogram", "End-to-end run latency"),
+    "rag_ttft_seconds": ("histogram", "Time to first writer token (streaming runs)"),
+    "rag_node_latency_seconds": ("histogram", "Latency per graph node execution"),
+}
+
+SNAPSHOT_PATH = os.getenv("METRICS_SNAPSHOT", "")
+SNAPSHOT_INTERVAL = float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "15"))
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in sorted(labels.items()):
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Registry:
+    """Thread-safe counters and histograms rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = _Histogram(LATENCY_BUCKETS)
+            hist.observe(value)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in METRICS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for (n, labels), value in sorted(self._counters.items()):
+                        if n == name:
+                            lines.append(f"{name}{_labels(dict(labels))} {value}")
+                    continue
+
+                for (n, labels), hist in sorted(self._histograms.items()):
+                    if n != name:
+                        continue
+                    labels = dict(labels)
+                    cumulative = 0
+                    for bound, count in zip(list(hist.buckets) + ["+Inf"], hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {round(hist.sum, 6)}")
+                    lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# ---------------------------------------------------------------------
+# Recording helpers
+# ---------------------------------------------------------------------
+
+def observe_node(node: str, duration_ms: float) -> None:
+    REGISTRY.observe("rag_node_latency_seconds", duration_ms / 1000, node=node)
+
+
+def record_llm(node: str, cache_hit: bool, usage=None) -> None:
+    REGISTRY.inc("rag_llm_requests_total", node=node, cache="hit" if cache_hit else "miss")
+    if usage is None:
+        return
+    REGISTRY.inc("rag_llm_tokens_total", getattr(usage, "prompt_tokens", 0) or 0, node=node, kind="prompt")
+    REGISTRY.inc("rag_llm_tokens_total", getattr(usage, "completion_tokens", 0) or 0, node=node, kind="completion")
+
+
+def record_run(state: AgentState) -> None:
+    """Update run-level counters and histograms from a finished run."""
+    trace = state.get("trace") or []
+    REGISTRY.inc("rag_runs_total")
+    if any(e.get("agent") == "guardrails" and e.get("action") == "blocked" for e in trace):
+        REGISTRY.inc("rag_runs_blocked_total")
+    if state.get("retried"):
+        REGISTRY.inc("rag_runs_retried_total")
+    if any(e.get("agent") == "retriever" and e.get("action") == "no_evidence" for e in trace):
+        REGISTRY.inc("rag_runs_no_evidence_total")
+
+    status = (state.get("answer_cache") or {}).get("status")
+    if status:
+        REGISTRY.inc("rag_answer_cache_total", status=status)
+
+    if state.get("latency_ms") is not None:
+        REGISTRY.observe("rag_run_latency_seconds", state["latency_ms"] / 1000)
+    if state.get("ttft_ms") is not None:
+        REGISTRY.observe("rag_ttft_seconds", state["ttft_ms"] / 1000)
+
+    maybe_write_snapshot()
+
+
+# ---------------------------------------------------------------------
+# Exposure: HTTP endpoint and/or snapshot file
+# ---------------------------------------------------------------------
+
+_last_snapshot = 0.0
+_snapshot_lock = threading.Lock()
+
+
+def write_snapshot(path) -> None:
+    """Write the current metrics atomically (node_exporter textfile format)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(REGISTRY.render(), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def maybe_write_snapshot() -> None:
+    global _last_snapshot
+    if not SNAPSHOT_PATH:
+        return
+    now = time.monotonic()
+    with _snapshot_lock:
+        if now - _last_snapshot < SNAPSHOT_INTERVAL:
+            return
+        _last_snapshot = now
+        write_snapshot(SNAPSHOT_PATH)
+
+
+if SNAPSHOT_PATH:
+    # Final flush so short-lived processes (eval, CLI) leave complete numbers
+    atexit.register(lambda: write_snapshot(SNAPSHOT_PATH))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_http_server(port: int, host: str = "0.0.0.0"):
+    """Serve /metrics from a daemon thread (once per process)."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server
+
+
+def start_from_env() -> None:
+    """Start the endpoint when METRICS_PORT is set; called from graph.warm_up()."""
+    port = os.getenv("METRICS_PORT")
+    if not port:
+        return
+    try:
+        start_http_server(int(port))
+    except OSError as e:
+        # Another process (e.g. a second Streamlit worker) already owns the port
+        print(f"Metrics endpoint not started on port {port}: {e}")
@@ -1,12 +1,39 @@
+import os
+import sys
+import gzip
 import json
+import queue
+import atexit
+import shutil
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List
+
+from agents import run_store
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 LOG_DIR = Path("logs")
 LOG_FILE = LOG_DIR / "runs.jsonl"
+LOCK_FILE = LOG_DIR / "runs.jsonl.lock"
 LOG_DIR.mkdir(exist_ok=True)
 
+# save_run() only enqueues; a background thread serializes and appends in batches
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1") == "1"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "1000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+
+# Rotation: "size" (LOG_MAX_BYTES), "daily" (UTC day of the last write) or "none"
+LOG_ROTATE = os.getenv("LOG_ROTATE", "size")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(100 * 1024 * 1024)))
+LOG_COMPRESS = os.getenv("LOG_COMPRESS", "1") == "1"
+
 
 def _safe_state_snapshot(state: Dict[str, Any]) -> Dict[str, Any]:
 
@@ -24,10 +51,14 @@ def _safe_state_snapshot(state: Dict[str, Any]) -> Dict[str, Any]:
 
         c = n.get("citation") or {}
 
-        notes_compact.append({
+        compact = {
+            "chunk_id": n.get("chunk_id"),
             "citation": c,
             "score": n.get("score"),
-        })
+        }
+        if "rerank_score" in n:
+            compact["rerank_score"] = n["rerank_score"]
+        notes_compact.append(compact)
 
 
 
@@ -39,12 +70,158 @@ def _safe_state_snapshot(state: Dict[str, Any]) -> Dict[str, Any]:
         "trace": state.get("trace", []) or [],      
         "notes": notes_compact,
         "retried": bool(state.get("retried", False)),
+        "answer_cache": (state.get("answer_cache") or {}).get("status"),
+        "llm_cache": state.get("llm_cache") or {},
         "latency_ms": state.get("latency_ms"),
+        "ttft_ms": state.get("ttft_ms"),
+        "node_ms": state.get("node_ms") or {},
+        "spans": state.get("spans") or [],
     }
 
 
+# ---------------------------------------------------------------------
+# File writes (cross-process lock + rotation)
+# ---------------------------------------------------------------------
+
+@contextmanager
+def _file_lock():
+    """Exclusive lock shared by every process writing runs.jsonl."""
+    with open(LOCK_FILE, "a+b") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        else:
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _rotation_target():
+    """Return the path to rotate LOG_FILE to, or None if no rotation is due."""
+    if LOG_ROTATE == "none" or not LOG_FILE.exists():
+        return None
+    st = LOG_FILE.stat()
+    if st.st_size == 0:
+        return None
+
+    if LOG_ROTATE == "daily":
+        day = datetime.fromtimestamp(st.st_mtime, timezone.utc).date()
+        if day == datetime.now(timezone.utc).date():
+            return None
+        stamp = day.isoformat()
+    elif st.st_size >= LOG_MAX_BYTES:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    else:
+        return None
+
+    target = LOG_DIR / f"runs-{stamp}.jsonl"
+    n = 1
+    while target.exists() or target.with_name(target.name + ".gz").exists():
+        target = LOG_DIR / f"runs-{stamp}-{n}.jsonl"
+        n += 1
+    return target
+
+
+def _compress(path: Path) -> None:
+    with open(path, "rb") as src, gzip.open(str(path) + ".gz", "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    path.unlink()
+
+
+def _write_lines(lines: List[str]) -> None:
+    rotated = None
+    with _file_lock():
+        target = _rotation_target()
+        if target is not None:
+            os.replace(LOG_FILE, target)
+            rotated = target
+        with open(LOG_FILE, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+
+    # Rotated file has a unique name, so compression can run without the lock
+    if rotated is not None and LOG_COMPRESS:
+        _compress(rotated)
+
+
+def _persist(records: List[Dict[str, Any]]) -> None:
+    _write_lines([json.dumps(r, ensure_ascii=False) + "\n" for r in records])
+    if run_store.is_enabled():
+        run_store.get_run_store().insert_many(records)
+
+
+# ---------------------------------------------------------------------
+# Background writer
+# ---------------------------------------------------------------------
+
+_STOP = object()
+
+
+class _LogWriter(threading.Thread):
+    """Drains queued records and appends them in batches."""
+
+    def __init__(self):
+        super().__init__(name="runs-log-writer", daemon=True)
+        self.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            # Whatever piled up while the last batch was written goes out in one write
+            while len(batch) < LOG_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            records = [r for r in batch if r is not _STOP]
+            stopping = len(records) != len(batch)
+            try:
+                if records:
+                    _persist(records)
+            except Exception as e:
+                print(f"runs.jsonl writer: dropped {len(records)} records: {e}", file=sys.stderr)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self.queue.put(_STOP)
+        self.join(timeout)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer() -> _LogWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = _LogWriter()
+                _writer.start()
+                atexit.register(_writer.stop)
+    return _writer
+
+
+def flush() -> None:
+    """Block until every queued record has been written."""
+    if _writer is not None:
+        _writer.queue.join()
+
+
 def save_run(state: Dict[str, Any]) -> str:
     record = _safe_state_snapshot(state)
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    if LOG_ASYNC:
+        # Blocks only when the queue is full (backpressure instead of dropping runs)
+        _get_writer().queue.put(record)
+    else:
+        _persist([record])
     return str(LOG_FILE)
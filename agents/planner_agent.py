@@ -2,10 +2,120 @@ import re
 from agents.state import AgentState, add_trace
 
 
-# --- Intent detection helpers ---
-
-def _contains(task: str, *words) -> bool:
-    return any(re.search(rf"\b{w}\b", task, re.I) for w in words)
+# --- Intent routing table ---
+#
+# Each keyword used to be matched with re.search(rf"\b{w}\b", task, re.I).
+# A single-word keyword matches iff it equals a whole \w+ token of the task,
+# and a two-word keyword iff it equals two adjacent tokens joined by their
+# exact separator, so one tokenization pass plus set lookups gives the same
+# answers. Routes are tried in order; the first match wins.
+
+ROUTES = [
+    # Business-only: greetings / small talk → don't answer
+    ("smalltalk", {"hi", "hello", "hey", "yo", "sup", "thanks", "thank you"}, [
+        "Not found in the sources.",
+    ]),
+    # Ranking / "top N" / "best"
+    ("ranking", {"top", "best", "rank", "ranking", "highest", "lowest", "<top_n>"}, [
+        "Top results (ranked, with citations)",
+        "Evidence per item (1–2 lines)",
+    ]),
+    # List / enumerate / "tell me" / "show me"
+    ("list", {"list", "show", "give", "provide", "tell me", "tell us", "<ends_with_colon>"}, [
+        "List of items (with citations)",
+    ]),
+    # "Why" questions → rationale + evidence + implications
+    ("why", {"why", "reason", "rationale"}, [
+        "Direct answer (with citations)",
+        "Key reasons (with citations)",
+        "Implications / what it means",
+    ]),
+    # "How" questions → steps/process + caveats
+    ("how", {"how", "steps", "process", "approach", "implement"}, [
+        "Direct answer (with citations)",
+        "Steps / approach (with citations)",
+        "Pitfalls / caveats (with citations)",
+    ]),
+    # "Where" / "used in" / "applied in"
+    ("where", {"where", "used", "applied", "application", "use case", "use-case"}, [
+        "Direct answer (with citations)",
+        "Where it applies (grouped by category/stage)",
+        "Examples (with citations)",
+    ]),
+    # Comparison
+    ("compare", {"compare", "difference", "vs"}, [
+        "Comparison summary (with citations)",
+        "Key differences (with citations)",
+        "Implications",
+    ]),
+    # Risks ("mitigat" only matches that exact token, as before)
+    ("risks", {"risk", "mitigat", "threat", "challenge", "issue", "problem"}, [
+        "Main risks / issues (with citations)",
+        "Mitigations (with citations)",
+        "Practical advice",
+    ]),
+    # Definition / explanation
+    ("definition", {"define", "what is", "explain", "meaning"}, [
+        "Explanation (with citations)",
+        "Examples (with citations)",
+        "Limitations",
+    ]),
+]
+
+# Default business answer (structured, not too generic)
+DEFAULT_ROUTE = ("default", [
+    "Direct answer (with citations)",
+    "Key points (with citations)",
+    "Recommendations (if supported by sources)",
+])
+
+# Email override (keep business-style)
+EMAIL_KEYWORDS = {"email", "draft", "message"}
+EMAIL_SECTIONS = ["Email draft (grounded in sources)"]
+
+DIRECT_REQUEST_KEYWORDS = {
+    "list", "show", "give", "tell", "top", "rank",
+    "why", "how", "compare", "difference", "vs",
+    "define", "what is", "explain",
+}
+
+_WORD_RE = re.compile(r"\w+")
+
+# Characters re.I treats as ASCII letters that str.lower() leaves alone
+_CASE_FOLD = str.maketrans({"\u0131": "i", "\u017f": "s"})
+
+
+def _features(task: str) -> set:
+    """Tokens, adjacent-token pairs (with their separator) and marker flags of a lowercased task."""
+    task = task.translate(_CASE_FOLD)
+    features = set()
+    prev = None
+    for m in _WORD_RE.finditer(task):
+        tok = m.group()
+        features.add(tok)
+        if prev is not None:
+            features.add(prev.group() + task[prev.end():m.start()] + tok)
+        prev = m
+
+    # \btop\s*\d+\b: "top 5" already yields "top", so only "top5" needs a marker
+    if any(t[3:].isdecimal() for t in features if t.startswith("top")):
+        features.add("<top_n>")
+    if task.strip().endswith(":"):
+        features.add("<ends_with_colon>")
+    return features
+
+
+def route(task: str):
+    """Return (intent, deliverable_sections, features) for a lowercased task."""
+    features = _features(task)
+    intent, sections = DEFAULT_ROUTE
+    for name, keywords, route_sections in ROUTES:
+        if not features.isdisjoint(keywords):
+            intent, sections = name, route_sections
+            break
+    if not features.isdisjoint(EMAIL_KEYWORDS):
+        sections = EMAIL_SECTIONS
+    return intent, list(sections), features
 
 
 def _task_length(task: str) -> int:
@@ -50,13 +160,10 @@ def run(state: AgentState) -> AgentState:
     # Light enrichment based on intent (not domain hardcoded)
     intent_tags = []
 
+    intent, sections, features = route(task)
+
     # Only enrich if task is very short/vague AND not obviously a direct request
-    is_direct_request = _contains(
-        task,
-        "list", "show", "give", "tell", "top", "rank",
-        "why", "how", "compare", "difference", "vs",
-        "define", "what is", "explain"
-    )
+    is_direct_request = not features.isdisjoint(DIRECT_REQUEST_KEYWORDS)
 
     if _task_length(task) <= 6 and intent_tags and not is_direct_request:
         retrieval_query = f"{original_task} {' '.join(intent_tags)} evidence"
@@ -65,88 +172,9 @@ def run(state: AgentState) -> AgentState:
     state["retrieval_query"] = retrieval_query
 
     # ------------------------------------------------------------
-    # 4) Decide output format dynamically (generalized intent routing)
+    # 4) Decide output format (compiled routing table, see ROUTES)
     # ------------------------------------------------------------
 
-    sections = []
-
-    # Business-only: greetings / small talk → don't answer
-    if _contains(task, "hi", "hello", "hey", "yo", "sup", "thanks", "thank you"):
-        sections = ["Not found in the sources."]
-
-    # Ranking / "top N" / "best"
-    elif _contains(task, "top", "best", "rank", "ranking", "highest", "lowest") or re.search(r"\btop\s*\d+\b", task):
-        sections = [
-            "Top results (ranked, with citations)",
-            "Evidence per item (1–2 lines)",
-        ]
-
-    # List / enumerate / "tell me" / "show me"
-    elif _contains(task, "list", "show", "give", "provide", "tell me", "tell us") or task.strip().endswith(":"):
-        sections = [
-            "List of items (with citations)",
-        ]
-
-    # "Why" questions → rationale + evidence + implications
-    elif _contains(task, "why", "reason", "rationale"):
-        sections = [
-            "Direct answer (with citations)",
-            "Key reasons (with citations)",
-            "Implications / what it means",
-        ]
-
-    # "How" questions → steps/process + caveats
-    elif _contains(task, "how", "steps", "process", "approach", "implement"):
-        sections = [
-            "Direct answer (with citations)",
-            "Steps / approach (with citations)",
-            "Pitfalls / caveats (with citations)",
-        ]
-
-    # "Where" / "used in" / "applied in"
-    elif _contains(task, "where", "used", "applied", "application", "use case", "use-case"):
-        sections = [
-            "Direct answer (with citations)",
-            "Where it applies (grouped by category/stage)",
-            "Examples (with citations)",
-        ]
-
-    # Comparison
-    elif _contains(task, "compare", "difference", "vs"):
-        sections = [
-            "Comparison summary (with citations)",
-            "Key differences (with citations)",
-            "Implications",
-        ]
-
-    # Risks
-    elif _contains(task, "risk", "mitigat", "threat", "challenge", "issue", "problem"):
-        sections = [
-            "Main risks / issues (with citations)",
-            "Mitigations (with citations)",
-            "Practical advice",
-        ]
-
-    # Definition / explanation
-    elif _contains(task, "define", "what is", "explain", "meaning"):
-        sections = [
-            "Explanation (with citations)",
-            "Examples (with citations)",
-            "Limitations",
-        ]
-
-    # Default business answer (structured, not too generic)
-    else:
-        sections = [
-            "Direct answer (with citations)",
-            "Key points (with citations)",
-            "Recommendations (if supported by sources)",
-        ]
-
-    # Email override (keep business-style)
-    if _contains(task, "email", "draft", "message"):
-        sections = ["Email draft (grounded in sources)"]
-
     state["deliverable_sections"] = sections
 
 
@@ -175,6 +203,7 @@ def run(state: AgentState) -> AgentState:
             "tools": tools,
             "steps": plan_steps,
             "retrieval_query": retrieval_query,
+            "intent": intent,
             "sections": sections,
         },
     )
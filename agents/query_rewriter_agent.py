@@ -1,21 +1,17 @@
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from agents.state import AgentState, add_trace
+from agents.llm_cache import acomplete, complete, node_counters
 
 load_dotenv()
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+aclient = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 
-def run(state: AgentState) -> AgentState:
-    """
-    Produces a better retrieval query and stores it in state["retrieval_query"].
-    Uses task + deliverable sections + (optionally) a short excerpt of the draft issues.
-    """
-    if not os.getenv("OPENAI_API_KEY"):
-        raise RuntimeError("Missing OPENAI_API_KEY in environment/.env")
-
+def _build_prompt(state: AgentState):
+    """Return (system, user, temperature) for the rewrite call."""
     task = state.get("task", "")
     current_query = state.get("retrieval_query", task)
     sections = state.get("deliverable_sections", [])
@@ -45,16 +41,12 @@ def run(state: AgentState) -> AgentState:
     )
 
     temp = 0 if os.getenv("EVAL_MODE") == "1" else 0.2
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user},
-        ],
-        temperature=temp,
-    )
+    return system, user, temp
+
+
+def apply_query(state: AgentState, new_query: str, meta=None) -> AgentState:
+    current_query = state.get("retrieval_query", state.get("task", ""))
 
-    new_query = (resp.choices[0].message.content or "").strip()
     # small cleanup: keep single line
     new_query = " ".join(new_query.split())
 
@@ -68,6 +60,33 @@ def run(state: AgentState) -> AgentState:
         "query_rewriter",
         "rewrite",
         "Rewrote retrieval query for retry",
-        meta={"old_query": current_query, "new_query": new_query},
+        meta={
+            "old_query": current_query,
+            "new_query": new_query,
+            "llm_cache": node_counters(state, "query_rewriter"),
+            **(meta or {}),
+        },
     )
     return state
+
+
+def run(state: AgentState) -> AgentState:
+    """
+    Produces a better retrieval query and stores it in state["retrieval_query"].
+    Uses task + deliverable sections + (optionally) a short excerpt of the draft issues.
+    """
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("Missing OPENAI_API_KEY in environment/.env")
+
+    system, user, temp = _build_prompt(state)
+    new_query = complete(state, "query_rewriter", client, "gpt-4o-mini", temp, system, user)
+    return apply_query(state, new_query)
+
+
+async def arun(state: AgentState) -> AgentState:
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("Missing OPENAI_API_KEY in environment/.env")
+
+    system, user, temp = _build_prompt(state)
+    new_query = await acomplete(state, "query_rewriter", aclient, "gpt-4o-mini", temp, system, user)
+    return apply_query(state, new_query)
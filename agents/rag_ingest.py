@@ -1,32 +1,66 @@
 import os
 import json
+import uuid
+import hashlib
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
 
 import fitz  # PyMuPDF
 import faiss
+import numpy as np
 from sentence_transformers import SentenceTransformer
 
+from agents.bm25_index import BM25_PATH, build_bm25, load_bm25
+from agents.chunk_store import ChunkStore, STORE_PATH
+from agents.embedding_cache import EmbeddingCache
+
 
 RAW_PDFS_DIR = Path("data/raw_pdfs")
 INDEX_DIR = Path("data/index")
 INDEX_PATH = INDEX_DIR / "index.faiss"
-META_PATH = INDEX_DIR / "metadata.jsonl"
+INDEX_CONFIG_PATH = INDEX_DIR / "index_config.json"
+MANIFEST_PATH = INDEX_DIR / "manifest.json"
 
 # Chunking settings (good defaults)
 CHUNK_SIZE = 900      # characters
 CHUNK_OVERLAP = 150   # characters
 EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
 
+# Index settings ("flat" is exact search; the others are approximate)
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_sq8", "ivf_pq")
+DEFAULT_INDEX_TYPE = "flat"
+IVF_NLIST = 1024        # inverted lists (clamped for small corpora)
+IVF_NPROBE = 16         # lists visited per query
+HNSW_M = 32             # graph neighbours per node
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+PQ_M = 48               # sub-quantizers, must divide the embedding dim
+PQ_NBITS = 8            # bits per sub-quantizer code (2**nbits centroids to train)
+PQ_MIN_NBITS = 4        # below this PQ codes are too coarse to be useful
+TRAIN_SIZE = 100_000    # max vectors sampled for training
+MIN_POINTS_PER_LIST = 39  # faiss warns below this
+
+# Extraction / embedding settings
+EXTRACT_WORKERS = os.cpu_count() or 1
+PAGES_PER_TASK = 100    # larger PDFs are split into page ranges across workers
+EMBED_BATCH_SIZE = 256  # chunks embedded and added to the index at a time
+
 
-def extract_pdf_pages(pdf_path: Path):
-    """Return list of (page_number, text) from a PDF."""
+def extract_pdf_pages(pdf_path: Path, start: int = 0, end: int = None):
+    """Return list of (page_number, text) from a PDF (optionally a page range)."""
     doc = fitz.open(pdf_path)
     pages = []
-    for i in range(len(doc)):
+    for i in range(start, len(doc) if end is None else min(end, len(doc))):
         text = doc.load_page(i).get_text("text") or ""
         text = " ".join(text.split())  # normalize whitespace
         if text.strip():
             pages.append((i + 1, text))
+    doc.close()
     return pages
 
 
@@ -45,61 +79,481 @@ def chunk_text(text: str, chunk_size: int, overlap: int):
     return chunks
 
 
-def main():
-    if not RAW_PDFS_DIR.exists():
-        raise FileNotFoundError(f"Missing folder: {RAW_PDFS_DIR}")
+def _extract_and_chunk(task):
+    """Worker: extract one page range of a PDF and chunk each page."""
+    pdf_path, start, end = task
+    return [
+        (page_num, chunk_text(page_text, CHUNK_SIZE, CHUNK_OVERLAP))
+        for page_num, page_text in extract_pdf_pages(pdf_path, start, end)
+    ]
 
-    pdf_files = sorted([p for p in RAW_PDFS_DIR.glob("*.pdf")])
-    if not pdf_files:
-        raise FileNotFoundError(f"No PDFs found in {RAW_PDFS_DIR}")
 
-    INDEX_DIR.mkdir(parents=True, exist_ok=True)
+def _page_count(pdf_path: Path) -> int:
+    with fitz.open(pdf_path) as doc:
+        return len(doc)
+
+
+def iter_pdf_chunks(pdf_files, workers: int = EXTRACT_WORKERS, pages_per_task: int = PAGES_PER_TASK):
+    """
+    Yield (pdf, [(page_number, chunks), ...]) per page range, in input order.
+    Ranges are extracted in a process pool with at most 2 * workers tasks in
+    flight and consumed in submission order, so chunk ids stay reproducible.
+    """
+    def _tasks():
+        for pdf in pdf_files:
+            n_pages = _page_count(pdf)
+            for start in range(0, max(n_pages, 1), pages_per_task):
+                yield (pdf, start, start + pages_per_task)
 
-    model = SentenceTransformer(EMBED_MODEL_NAME)
+    if workers <= 1:
+        for task in _tasks():
+            yield task[0], _extract_and_chunk(task)
+        return
 
-    all_texts = []
-    metadata_rows = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for task in _tasks():
+            in_flight.append((task[0], executor.submit(_extract_and_chunk, task)))
+            if len(in_flight) >= 2 * workers:
+                pdf, future = in_flight.popleft()
+                yield pdf, future.result()
+        while in_flight:
+            pdf, future = in_flight.popleft()
+            yield pdf, future.result()
 
-    print(f"Found {len(pdf_files)} PDFs. Extracting and chunking...")
 
-    chunk_global_id = 0
-    for pdf in pdf_files:
-        pages = extract_pdf_pages(pdf)
-        for page_num, page_text in pages:
-            chunks = chunk_text(page_text, CHUNK_SIZE, CHUNK_OVERLAP)
+def iter_chunk_rows(pdf_files, manifest: dict, hashes: dict, workers: int):
+    """
+    Yield metadata rows for every chunk, numbering ids from manifest["next_id"].
+    Each PDF's id range is recorded in the manifest once it has been consumed.
+    """
+    chunk_global_id = manifest["next_id"]
+    current, first_id = None, None
+
+    def _record(pdf):
+        manifest["files"][pdf.name] = {
+            "sha256": hashes[pdf.name],
+            "first_id": first_id,
+            "n_chunks": chunk_global_id - first_id,
+        }
+
+    for pdf, pages in iter_pdf_chunks(pdf_files, workers):
+        if pdf != current:
+            if current is not None:
+                _record(current)
+            current, first_id = pdf, chunk_global_id
+
+        for page_num, chunks in pages:
             for local_chunk_id, chunk in enumerate(chunks):
-                all_texts.append(chunk)
-                metadata_rows.append({
+                yield {
                     "id": chunk_global_id,
                     "source_file": pdf.name,
                     "page": page_num,
                     "chunk_in_page": local_chunk_id,
                     "text": chunk
-                })
+                }
                 chunk_global_id += 1
 
-    if not all_texts:
-        raise RuntimeError("No text extracted from PDFs. Are they scanned images?")
+    if current is not None:
+        _record(current)
+    manifest["next_id"] = chunk_global_id
+
+
+def _batched(iterable, n: int):
+    it = iter(iterable)
+    while batch := list(islice(it, n)):
+        yield batch
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def index_factory_string(index_type: str, nlist: int, hnsw_m: int, pq_m: int, pq_nbits: int = PQ_NBITS) -> str:
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m}"
+    if index_type == "ivf_sq8":
+        return f"IVF{nlist},SQ8"
+    if index_type == "ivf_pq":
+        return f"IVF{nlist},PQ{pq_m}" if pq_nbits == PQ_NBITS else f"IVF{nlist},PQ{pq_m}x{pq_nbits}"
+    raise ValueError(f"Unknown index type: {index_type} (expected one of {', '.join(INDEX_TYPES)})")
+
+
+def pq_nbits_for(train_n: int) -> int:
+    """
+    PQ trains 2**nbits centroids per sub-quantizer and faiss refuses fewer
+    training points than centroids, so small corpora get smaller codes.
+    """
+    nbits = min(PQ_NBITS, train_n.bit_length() - 1) if train_n > 0 else 0
+    if nbits < PQ_MIN_NBITS:
+        raise ValueError(
+            f"--index-type ivf_pq needs at least {2 ** PQ_MIN_NBITS} chunks to train "
+            f"(got {train_n}); use --index-type flat or ivf_flat for a corpus this small"
+        )
+    return nbits
+
+
+def search_params_for(args, index) -> dict:
+    """Query-time parameters stored in index_config.json (never require a rebuild)."""
+    if args.index_type == "hnsw":
+        return {"efSearch": args.ef_search}
+    if args.index_type != "flat":
+        return {"nprobe": min(args.nprobe, faiss.extract_index_ivf(index).nlist)}
+    return {}
+
+
+def build_index(embeddings, ids, args):
+    """
+    Build (and train, if needed) a FAISS index for normalized embeddings.
+    Vectors are added under their chunk ids so they can later be removed.
+    Returns (index, config) where config is written next to the index so
+    rag_retrieve knows the index type and its search parameters.
+    """
+    n, dim = embeddings.shape
+
+    # IVF needs enough training points per list; shrink nlist for small corpora
+    nlist = max(1, min(args.nlist, n // MIN_POINTS_PER_LIST))
+    if args.index_type == "ivf_pq" and dim % args.pq_m != 0:
+        raise ValueError(f"--pq-m ({args.pq_m}) must divide the embedding dim ({dim})")
+
+    train_n = min(n, args.train_size)
+    pq_nbits = pq_nbits_for(train_n) if args.index_type == "ivf_pq" else PQ_NBITS
+    if pq_nbits != PQ_NBITS:
+        print(f"Only {train_n} training vectors; using {pq_nbits}-bit PQ codes instead of {PQ_NBITS}-bit.")
+
+    factory = index_factory_string(args.index_type, nlist, args.hnsw_m, args.pq_m, pq_nbits)
+    index = faiss.index_factory(dim, factory, faiss.METRIC_INNER_PRODUCT)
+
+    if args.index_type == "hnsw":
+        index.hnsw.efConstruction = args.ef_construction
+    search_params = search_params_for(args, index)
+
+    if not index.is_trained:
+        rng = np.random.default_rng(0)
+        sample = embeddings[np.sort(rng.choice(n, size=train_n, replace=False))]
+        print(f"Training {factory} on {train_n} vectors...")
+        index.train(sample)
+
+    # IVF indexes store ids natively; flat and HNSW need an id map
+    if not args.index_type.startswith("ivf"):
+        index = faiss.IndexIDMap(index)
+    index.add_with_ids(embeddings, ids)
+
+    config = {
+        "index_type": args.index_type,
+        "factory": factory,
+        "metric": "inner_product",
+        "dim": dim,
+        "embed_model": EMBED_MODEL_NAME,
+        "search_params": search_params,
+    }
+    return index, config
+
+
+class IndexSink:
+    """
+    Receives normalized embedding batches and adds them to the index.
+    When rebuilding, the index is created once enough vectors are buffered
+    to train it (IVF) or from the first batch (flat/HNSW), so memory beyond
+    the index itself is bounded by max(batch size, --train-size).
+    """
+
+    def __init__(self, args, index=None, config=None):
+        self.args = args
+        self.index = index
+        self.config = config
+        self._vecs = []
+        self._ids = []
+        self._buffered = 0
+        self._target = args.train_size if args.index_type.startswith("ivf") else 0
+
+    def add(self, embeddings, ids):
+        if self.index is not None:
+            self.index.add_with_ids(embeddings, ids)
+            return
+        self._vecs.append(embeddings)
+        self._ids.append(ids)
+        self._buffered += len(ids)
+        if self._buffered >= self._target:
+            self._build()
+
+    def _build(self):
+        embeddings, ids = np.concatenate(self._vecs), np.concatenate(self._ids)
+        self._vecs, self._ids, self._buffered = [], [], 0
+        self.index, self.config = build_index(embeddings, ids, self.args)
+
+    def finish(self):
+        if self.index is None and self._vecs:
+            self._build()
+        return self.index, self.config
+
+
+def ingest_settings(args) -> dict:
+    # Any change here invalidates stored chunk ids/vectors and forces a rebuild
+    return {
+        "embed_model": EMBED_MODEL_NAME,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "index_type": args.index_type,
+        "nlist": args.nlist,
+        "hnsw_m": args.hnsw_m,
+        "pq_m": args.pq_m,
+    }
+
+
+def load_manifest():
+    if not MANIFEST_PATH.exists():
+        return None
+    return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+
 
-    print(f"Total chunks: {len(all_texts)}. Embedding...")
-    embeddings = model.encode(all_texts, show_progress_bar=True, convert_to_numpy=True)
+def _new_manifest(settings: dict) -> dict:
+    return {"version": None, "settings": settings, "next_id": 0, "files": {}}
 
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dim)  # cosine-like similarity if embeddings are normalized
-    # Normalize vectors for cosine similarity
+
+@lru_cache(maxsize=1)
+def _embed_model():
+    # Loaded on first cache miss; a fully cached run never loads the model
+    return SentenceTransformer(EMBED_MODEL_NAME)
+
+
+def _encode(texts):
+    embeddings = _embed_model().encode(texts, show_progress_bar=False, convert_to_numpy=True)
+    # Normalize vectors for cosine similarity (inner product on unit vectors)
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
     faiss.normalize_L2(embeddings)
-    index.add(embeddings)
+    return embeddings
+
+
+def embed_texts(texts, cache: EmbeddingCache = None):
+    """Return normalized float32 embeddings, encoding only cache misses."""
+    if cache is None:
+        return _encode(texts)
+
+    cached = cache.get_many(texts)
+    miss_idx = [i for i, v in enumerate(cached) if v is None]
+    if miss_idx:
+        miss_texts = [texts[i] for i in miss_idx]
+        fresh = _encode(miss_texts)
+        cache.put_many(miss_texts, fresh)
+        for i, vec in zip(miss_idx, fresh):
+            cached[i] = vec
+    return np.ascontiguousarray(np.vstack(cached), dtype="float32")
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Build the FAISS index from PDFs in data/raw_pdfs")
+    ap.add_argument("--index-type", choices=INDEX_TYPES, default=os.getenv("INDEX_TYPE", DEFAULT_INDEX_TYPE))
+    ap.add_argument("--nlist", type=int, default=IVF_NLIST, help="IVF lists")
+    ap.add_argument("--nprobe", type=int, default=IVF_NPROBE, help="IVF lists searched per query")
+    ap.add_argument("--hnsw-m", type=int, default=HNSW_M)
+    ap.add_argument("--ef-construction", type=int, default=HNSW_EF_CONSTRUCTION)
+    ap.add_argument("--ef-search", type=int, default=HNSW_EF_SEARCH)
+    ap.add_argument("--pq-m", type=int, default=PQ_M, help="PQ sub-quantizers")
+    ap.add_argument("--train-size", type=int, default=TRAIN_SIZE, help="max vectors sampled for training")
+    ap.add_argument("--rebuild", action="store_true", help="ignore the manifest and re-index every PDF")
+    ap.add_argument("--workers", type=int, default=EXTRACT_WORKERS, help="processes used for PDF extraction")
+    ap.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="chunks embedded per batch")
+    ap.add_argument("--no-embed-cache", action="store_true", help="re-embed every chunk, ignoring data/cache")
+    return ap.parse_args(argv)
+
+
+def write_bm25(version: str):
+    """Rebuild the BM25 index from the live chunk store (tokenizing is cheap next to embedding)."""
+    t0 = time.perf_counter()
+    store = ChunkStore(STORE_PATH, readonly=True)
+    try:
+        bm25 = build_bm25(store.iter_rows(), version)
+    finally:
+        store.close()
+    print(f"Saved BM25 index: {BM25_PATH} ({len(bm25.terms)} terms, {len(bm25.docs)} postings, "
+          f"{(time.perf_counter() - t0) * 1000:.0f} ms)")
+    return bm25
+
+
+def update_bm25(old_version: str, drop_ids, rows, version: str):
+    """Apply an incremental ingest to the BM25 index; only the new chunks are tokenized."""
+    bm25 = load_bm25(old_version)
+    if bm25 is None:
+        return write_bm25(version)
+    t0 = time.perf_counter()
+    bm25 = bm25.update(drop_ids, rows, version)
+    bm25.save()
+    print(f"Updated BM25 index: {BM25_PATH} (-{len(drop_ids)} / +{len(rows)} chunks, "
+          f"{len(bm25.terms)} terms, {(time.perf_counter() - t0) * 1000:.0f} ms)")
+    return bm25
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if not RAW_PDFS_DIR.exists():
+        raise FileNotFoundError(f"Missing folder: {RAW_PDFS_DIR}")
+
+    pdf_files = sorted([p for p in RAW_PDFS_DIR.glob("*.pdf")])
+    if not pdf_files:
+        raise FileNotFoundError(f"No PDFs found in {RAW_PDFS_DIR}")
+
+    INDEX_DIR.mkdir(parents=True, exist_ok=True)
+
+    # ------------------------------------------------------------
+    # 1) Diff the PDF folder against the manifest
+    # ------------------------------------------------------------
+
+    settings = ingest_settings(args)
+    manifest = load_manifest()
+    hashes = {pdf.name: file_sha256(pdf) for pdf in pdf_files}
+
+    rebuild_reason = None
+    if args.rebuild:
+        rebuild_reason = "--rebuild"
+    elif manifest is None or not INDEX_PATH.exists() or not STORE_PATH.exists():
+        rebuild_reason = "no existing index/manifest"
+    elif manifest.get("settings") != settings:
+        rebuild_reason = "ingest settings changed"
+
+    # An interrupted run leaves the index, its config and the manifest disagreeing
+    index = None
+    if not rebuild_reason:
+        index = faiss.read_index(str(INDEX_PATH))
+        config = json.loads(INDEX_CONFIG_PATH.read_text(encoding="utf-8"))
+        expected = sum(f["n_chunks"] for f in manifest["files"].values())
+        if index.ntotal != expected or config.get("version") != manifest.get("version"):
+            rebuild_reason = "index out of sync with manifest"
+
+    old_files = {} if rebuild_reason else manifest["files"]
+    removed = sorted(n for n in old_files if n not in hashes)
+    changed = sorted(n for n in old_files if n in hashes and old_files[n]["sha256"] != hashes[n])
+    added = sorted(n for n in hashes if n not in old_files)
+
+    # HNSW graphs cannot delete vectors
+    if not rebuild_reason and args.index_type == "hnsw" and (removed or changed):
+        rebuild_reason = "HNSW index does not support removals"
+        old_files = {}
+        removed, changed, added = [], [], sorted(hashes)
+
+    if rebuild_reason:
+        print(f"Full rebuild ({rebuild_reason}).")
+        manifest = _new_manifest(settings)
+    else:
+        print(f"Incremental update: {len(added)} new, {len(changed)} changed, {len(removed)} removed, "
+              f"{len(hashes) - len(added) - len(changed)} unchanged.")
+
+    drop_ids = []
+    for name in removed + changed:
+        entry = manifest["files"].pop(name)
+        drop_ids.extend(range(entry["first_id"], entry["first_id"] + entry["n_chunks"]))
+
+    pending = set(added + changed)
+    to_process = [pdf for pdf in pdf_files if pdf.name in pending]
+    if not to_process and not drop_ids:
+        # --nprobe / --ef-search only change the config, not the index
+        params = search_params_for(args, index)
+        if config.get("search_params") != params:
+            config["search_params"] = params
+            INDEX_CONFIG_PATH.write_text(json.dumps(config, indent=2), encoding="utf-8")
+            print(f"Updated search params: {params}")
+        # Indexes built before hybrid retrieval have no BM25 index yet
+        if load_bm25(manifest["version"]) is None:
+            write_bm25(manifest["version"])
+        print("✅ Index is up to date.")
+        return
+
+    # ------------------------------------------------------------
+    # 2) Stream pages -> chunks -> embedding batches -> index + chunk store
+    # ------------------------------------------------------------
+
+    # A rebuild writes a fresh store next to the live one; an incremental
+    # update edits the live store in one transaction. Existing rows keep their ids.
+    if rebuild_reason:
+        store_tmp = STORE_PATH.with_suffix(".sqlite.tmp")
+        store_tmp.unlink(missing_ok=True)
+        store = ChunkStore(store_tmp)
+    else:
+        store_tmp = None
+        store = ChunkStore(STORE_PATH)
+
+    if drop_ids:
+        index.remove_ids(np.array(drop_ids, dtype="int64"))
+        store.delete_ids(drop_ids)
+
+    sink = IndexSink(args) if rebuild_reason else IndexSink(args, index, config)
+
+    print(f"Extracting and embedding {len(to_process)} PDFs "
+          f"({args.workers} workers, batches of {args.batch_size})...")
+
+    cache = None if args.no_embed_cache else EmbeddingCache(EMBED_MODEL_NAME)
+
+    # Text of new chunks for the incremental BM25 update
+    bm25_rows = []
+
+    n_chunks = 0
+    committed = False
+    t0 = time.perf_counter()
+    try:
+        if to_process:
+            rows = iter_chunk_rows(to_process, manifest, hashes, args.workers)
+            for batch in _batched(rows, args.batch_size):
+                embeddings = embed_texts([r["text"] for r in batch], cache)
+                sink.add(embeddings, np.array([r["id"] for r in batch], dtype="int64"))
+                store.add_rows(batch)
+                if not rebuild_reason:
+                    bm25_rows.extend({"id": r["id"], "text": r["text"]} for r in batch)
+
+                n_chunks += len(batch)
+                rate = n_chunks / max(time.perf_counter() - t0, 1e-9)
+                print(f"\r  {n_chunks} chunks ({rate:.1f} chunks/sec)", end="", flush=True)
+            print()
+
+        index, config = sink.finish()
+        if index is None:
+            raise RuntimeError("No text extracted from PDFs. Are they scanned images?")
+        store.commit()
+        committed = True
+    finally:
+        store.close()
+        if cache is not None:
+            cache.close()
+        if store_tmp is not None and not committed:
+            store_tmp.unlink(missing_ok=True)
+
+    # ------------------------------------------------------------
+    # 3) Save index, config, chunk store and BM25 index
+    # ------------------------------------------------------------
 
+    old_version = manifest.get("version")
+    version = uuid.uuid4().hex
+    config["version"] = version
+    config["search_params"] = search_params_for(args, index)
     faiss.write_index(index, str(INDEX_PATH))
+    INDEX_CONFIG_PATH.write_text(json.dumps(config, indent=2), encoding="utf-8")
+    if store_tmp is not None:
+        os.replace(store_tmp, STORE_PATH)
+    if rebuild_reason:
+        write_bm25(version)
+    else:
+        update_bm25(old_version, drop_ids, bm25_rows, version)
 
-    with open(META_PATH, "w", encoding="utf-8") as f:
-        for row in metadata_rows:
-            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    # Written last so a crash before this point triggers a rebuild next time
+    manifest["version"] = version
+    MANIFEST_PATH.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
 
     print("✅ Done.")
     print(f"Saved FAISS index: {INDEX_PATH}")
-    print(f"Saved metadata:  {META_PATH}")
-    print(f"Chunks indexed:  {index.ntotal}")
+    print(f"Saved chunks:    {STORE_PATH}")
+    print(f"Saved manifest:  {MANIFEST_PATH}")
+    print(f"Index type:      {config['factory']} {config['search_params']}")
+    print(f"Chunks indexed:  {index.ntotal} ({n_chunks} new)")
+    if cache is not None:
+        print(f"Embedding cache: {cache.hits} hits / {cache.misses} misses ({cache.hit_rate() * 100:.1f}% hit rate)")
 
 
 if __name__ == "__main__":
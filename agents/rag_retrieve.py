@@ -1,72 +1,269 @@
+import os
 import json
+import threading
+import time
 from pathlib import Path
 
 import faiss
 from sentence_transformers import SentenceTransformer
 
+from agents.bm25_index import BM25_PATH, load_bm25
+from agents.chunk_store import ChunkStore, STORE_PATH
+
 INDEX_DIR = Path("data/index")
 INDEX_PATH = INDEX_DIR / "index.faiss"
-META_PATH = INDEX_DIR / "metadata.jsonl"
+INDEX_CONFIG_PATH = INDEX_DIR / "index_config.json"
 
 EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
 
+# "dense" (FAISS only), "sparse" (BM25 only) or "hybrid" (both, fused with RRF)
+RETRIEVAL_MODES = ("dense", "sparse", "hybrid")
+DEFAULT_RETRIEVAL_MODE = "dense"  # hybrid stays opt-in until eval shows a gain
+FUSION_CANDIDATES = 20  # per retriever, before fusion
+RRF_K = 60              # rank damping constant from the RRF paper
 
-def _load_metadata():
-    rows = []
-    with open(META_PATH, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                rows.append(json.loads(line))
-    return rows
 
+def retrieval_mode() -> str:
+    mode = os.getenv("RETRIEVAL_MODE", DEFAULT_RETRIEVAL_MODE)
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"RETRIEVAL_MODE must be one of {RETRIEVAL_MODES}, got {mode!r}")
+    return mode
+
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K):
+    """Fuse ranked id lists: score(d) = sum 1 / (k + rank). Ties keep first-seen order."""
+    fused = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused, key=fused.get, reverse=True)
+
+
+def _load_index_config():
+    # Indexes built before index_config.json existed are exact flat indexes
+    if not INDEX_CONFIG_PATH.exists():
+        return {"index_type": "flat", "factory": "Flat", "search_params": {}}
+    return json.loads(INDEX_CONFIG_PATH.read_text(encoding="utf-8"))
+
+
+def _apply_search_params(index, search_params):
+    params = faiss.ParameterSpace()
+    for name, value in (search_params or {}).items():
+        params.set_index_parameter(index, name, value)
 
-def retrieve_notes(query: str, top_k: int = 5):
-    """Return list of notes with text + citation."""
-    if not INDEX_PATH.exists() or not META_PATH.exists():
-        raise FileNotFoundError("Run: python agents/rag_ingest.py first")
 
-    index = faiss.read_index(str(INDEX_PATH))
-    metadata = _load_metadata()
+class RetrievalEngine:
+    """
+    Keeps the FAISS index, BM25 index and embedder resident in memory;
+    chunk text and citations are fetched by id from the chunk store.
+    Reloads automatically when rag_ingest rewrites the index.
+    """
 
-    model = SentenceTransformer(EMBED_MODEL_NAME)
-    q_emb = model.encode([query], convert_to_numpy=True)
-    faiss.normalize_L2(q_emb)
+    def __init__(self, model_name: str = EMBED_MODEL_NAME):
+        self.model_name = model_name
+        self.index = None
+        self.store = None
+        self.bm25 = None
+        self.model = None
+        self.config = None
+        self.index_version = None
+        self.load_ms = None
+        self.last_timings = {}
+        self._index_mtime = None
+        self._lock = threading.Lock()
 
-    scores, ids = index.search(q_emb, top_k)
+    def _index_stamp(self):
+        # index_config.json changes alone when only search params are updated
+        config_mtime = INDEX_CONFIG_PATH.stat().st_mtime_ns if INDEX_CONFIG_PATH.exists() else None
+        bm25_mtime = BM25_PATH.stat().st_mtime_ns if BM25_PATH.exists() else None
+        return (INDEX_PATH.stat().st_mtime_ns, STORE_PATH.stat().st_mtime_ns, config_mtime, bm25_mtime)
 
-    notes = []
-    for doc_id, score in zip(ids[0], scores[0]):
-        if doc_id < 0:
-            continue
-        row = metadata[int(doc_id)]
+    def load(self) -> "RetrievalEngine":
+        if not INDEX_PATH.exists() or not STORE_PATH.exists():
+            raise FileNotFoundError("Run: python agents/rag_ingest.py first")
 
-        notes.append({
+        stamp = self._index_stamp()
+        if self.index is not None and stamp == self._index_mtime:
+            return self
+
+        with self._lock:
+            if self.index is not None and stamp == self._index_mtime:
+                return self
+
+            t0 = time.perf_counter()
+            if self.model is None:
+                self.model = SentenceTransformer(self.model_name)
+            index = faiss.read_index(str(INDEX_PATH))
+            config = _load_index_config()
+            _apply_search_params(index, config.get("search_params"))
+            # The previous store is closed when in-flight searches drop it
+            store = ChunkStore(STORE_PATH, readonly=True)
+            # A BM25 file from another index version is ignored (dense only until ingest finishes)
+            bm25 = load_bm25(config.get("version"))
+
+            self.index, self.store, self.bm25, self.config = index, store, bm25, config
+            self.index_version = config.get("version")
+            self._index_mtime = stamp
+            self.load_ms = round((time.perf_counter() - t0) * 1000, 2)
+        return self
+
+    def _row_to_note(self, row, score, sparse=None):
+        note = {
+            "chunk_id": int(row["id"]),
             "text": row["text"],
             "citation": {
                 "source_file": row["source_file"],
                 "page": row["page"],
                 "chunk_in_page": row["chunk_in_page"],
             },
-            "score": float(score),
+            "score": None if score is None else float(score),
+        }
+        if sparse is not None:
+            note["sparse_rank"], note["sparse_coverage"] = sparse
+        return note
+
+    def search_batch(self, queries, top_k: int = 5, mode: str = None):
+        """
+        Return (notes_per_query, timings). All queries are encoded in one
+        forward pass and searched with a single index.search call; in
+        sparse/hybrid mode each query is also scored against the BM25 index.
+        Note "score" is the dense cosine (None for chunks only BM25 found),
+        and notes BM25 ranked carry their 1-based "sparse_rank" and
+        "sparse_coverage" (see BM25Index.search); the order of the notes is
+        the fused order. Sparse mode skips the query embedding entirely.
+        """
+        self.load()
+        index, store, bm25 = self.index, self.store, self.bm25
+        mode = mode or retrieval_mode()
+        if bm25 is None:
+            mode = "dense"
+
+        timings = {"mode": mode, "encode_ms": 0.0, "search_ms": 0.0, "sparse_ms": 0.0,
+                   "fuse_ms": 0.0, "fetch_ms": 0.0, "queries": len(queries)}
+        if not queries:
+            return [], timings
+
+        n_candidates = top_k if mode == "dense" else max(top_k, FUSION_CANDIDATES)
+
+        t0 = time.perf_counter()
+        if mode != "sparse":
+            q_emb = self.model.encode(list(queries), convert_to_numpy=True)
+            faiss.normalize_L2(q_emb)
+        t1 = time.perf_counter()
+
+        dense = [[] for _ in queries]
+        if mode != "sparse":
+            scores, ids = index.search(q_emb, n_candidates)
+            dense = [[(int(i), float(s)) for i, s in zip(row_ids, row_scores) if i >= 0]
+                     for row_ids, row_scores in zip(ids, scores)]
+        t2 = time.perf_counter()
+
+        sparse = [[] for _ in queries]
+        if mode != "dense":
+            for qi, q in enumerate(queries):
+                ids, _, coverage = bm25.search(q, n_candidates)
+                sparse[qi] = [(int(i), round(float(c), 4)) for i, c in zip(ids, coverage)]
+        t3 = time.perf_counter()
+
+        # Per query: [(chunk_id, dense cosine or None, (BM25 rank, coverage) or None)] in final order
+        ranked = []
+        for dense_hits, sparse_hits in zip(dense, sparse):
+            cosine = dict(dense_hits)
+            sparse_ids = [doc_id for doc_id, _ in sparse_hits]
+            sparse_rank = {doc_id: (rank, c) for rank, (doc_id, c) in enumerate(sparse_hits, start=1)}
+            if mode == "dense":
+                order = [doc_id for doc_id, _ in dense_hits]
+            elif mode == "sparse":
+                order = sparse_ids
+            else:
+                order = reciprocal_rank_fusion([[doc_id for doc_id, _ in dense_hits], sparse_ids])
+            ranked.append([(doc_id, cosine.get(doc_id), sparse_rank.get(doc_id)) for doc_id in order[:top_k]])
+        t4 = time.perf_counter()
+
+        rows = store.get({doc_id for hits in ranked for doc_id, _, _ in hits})
+        t5 = time.perf_counter()
+
+        results = []
+        for hits in ranked:
+            results.append([self._row_to_note(rows[doc_id], score, rank)
+                            for doc_id, score, rank in hits if doc_id in rows])
+
+        timings.update({
+            "encode_ms": round((t1 - t0) * 1000, 2),
+            "search_ms": round((t2 - t1) * 1000, 2),
+            "sparse_ms": round((t3 - t2) * 1000, 2),
+            "fuse_ms": round((t4 - t3) * 1000, 2),
+            "fetch_ms": round((t5 - t4) * 1000, 2),
         })
+        self.last_timings = timings
+        return results, timings
+
+    def search(self, query: str, top_k: int = 5, mode: str = None):
+        """Return (notes, timings) for a single query."""
+        results, timings = self.search_batch([query], top_k, mode)
+        timings = {k: v for k, v in timings.items() if k != "queries"}
+        return results[0], timings
+
+    def stats(self):
+        return {
+            "loaded": self.index is not None,
+            "chunks": int(self.index.ntotal) if self.index is not None else 0,
+            "index_type": (self.config or {}).get("factory"),
+            "bm25_terms": len(self.bm25.terms) if self.bm25 is not None else 0,
+            "index_version": self.index_version,
+            "load_ms": self.load_ms,
+            **self.last_timings,
+        }
+
 
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> RetrievalEngine:
+    """Process-wide retrieval engine (created on first use)."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RetrievalEngine()
+    return _engine
+
+
+def retrieve_notes(query: str, top_k: int = 5):
+    """Return list of notes with text + citation."""
+    notes, _ = get_engine().search(query, top_k)
     return notes
 
 
+def retrieve_notes_batch(queries, top_k: int = 5):
+    """Return one list of notes per query, same as calling retrieve_notes on each."""
+    results, _ = get_engine().search_batch(queries, top_k)
+    return results
+
+
 def main():
-    query = input("Enter your question: ").strip()
-    if not query:
+    # Several questions can be given at once, separated by " || "
+    raw = input("Enter your question: ").strip()
+    queries = [q.strip() for q in raw.split("||") if q.strip()]
+    if not queries:
         return
 
-    notes = retrieve_notes(query)
+    for query, notes in zip(queries, retrieve_notes_batch(queries)):
+        print(f"\n=== Top results: {query} ===")
+        for i, n in enumerate(notes, start=1):
+            c = n["citation"]
+            score = "bm25 only" if n["score"] is None else f"{n['score']:.3f}"
+            print(f"\n#{i} score={score}")
+            print(f"Citation: {c['source_file']} | page {c['page']} | chunk {c['chunk_in_page']}")
+            print(n["text"][:400])
 
-    print("\n=== Top results ===")
-    for i, n in enumerate(notes, start=1):
-        c = n["citation"]
-        print(f"\n#{i} score={n['score']:.3f}")
-        print(f"Citation: {c['source_file']} | page {c['page']} | chunk {c['chunk_in_page']}")
-        print(n["text"][:400])
+    stats = get_engine().stats()
+    print(
+        f"\nmode={stats.get('mode')} | load={stats['load_ms']} ms | encode={stats.get('encode_ms')} ms"
+        f" | dense={stats.get('search_ms')} ms | sparse={stats.get('sparse_ms')} ms | fuse={stats.get('fuse_ms')} ms"
+        f" | fetch={stats.get('fetch_ms')} ms"
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))    # notes over-fetched and scored per query
+MAX_MS = float(os.getenv("RERANK_MAX_MS", "300"))          # latency cap for one scoring call
+CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))  # (query, chunk_id) scores kept in memory
+BATCH_SIZE = 32
+MAX_LENGTH = 512
+
+
+def is_enabled() -> bool:
+    return os.getenv("RERANK", "0") == "1"
+
+
+class Reranker:
+    """
+    Cross-encoder scoring of (query, chunk) pairs on CPU. All uncached
+    candidates of a query go through one batched predict call; scores are
+    cached per (index version, query, chunk_id) in a small LRU.
+
+    The call runs in a worker thread and is abandoned after MAX_MS (the
+    retrieval order is kept and the late scores still fill the cache).
+    Candidates are also trimmed up front when the measured cost per pair
+    says the batch would not fit in the cap.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL_NAME):
+        self.model_name = model_name
+        self.model = None
+        self.load_ms = None
+        self.ms_per_pair = None  # moving average of observed scoring cost
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rerank")
+
+    def load(self) -> "Reranker":
+        if self.model is None:
+            with self._lock:
+                if self.model is None:
+                    from sentence_transformers import CrossEncoder
+
+                    t0 = time.perf_counter()
+                    self.model = CrossEncoder(self.model_name, device="cpu", max_length=MAX_LENGTH)
+                    self.load_ms = round((time.perf_counter() - t0) * 1000, 2)
+        return self
+
+    # -----------------------------------------------------------------
+    # Score cache
+    # -----------------------------------------------------------------
+
+    def _cached(self, keys):
+        with self._lock:
+            out = {}
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    out[key] = self._cache[key]
+            return out
+
+    def _store(self, scores: dict) -> None:
+        with self._lock:
+            self._cache.update(scores)
+            for key in scores:
+                self._cache.move_to_end(key)
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    # -----------------------------------------------------------------
+    # Scoring
+    # -----------------------------------------------------------------
+
+    def _predict(self, query: str, notes, keys) -> dict:
+        t0 = time.perf_counter()
+        scores = self.model.predict([(query, n["text"]) for n in notes], batch_size=BATCH_SIZE,
+                                    show_progress_bar=False)
+        ms = (time.perf_counter() - t0) * 1000
+        per_pair = ms / max(len(notes), 1)
+        with self._lock:
+            self.ms_per_pair = per_pair if self.ms_per_pair is None else 0.8 * self.ms_per_pair + 0.2 * per_pair
+        scores = {key: float(s) for key, s in zip(keys, scores)}
+        self._store(scores)
+        return scores
+
+    def _budget(self, candidates, cached):
+        """Longest prefix of candidates whose uncached pairs fit in MAX_MS at the observed cost."""
+        if self.ms_per_pair is None:
+            return candidates
+        allowed = int(MAX_MS / max(self.ms_per_pair, 1e-6))
+        uncached = 0
+        for i, (key, _) in enumerate(candidates):
+            if key not in cached:
+                uncached += 1
+                if uncached > allowed:
+                    return candidates[:i]
+        return candidates
+
+    def rerank(self, query: str, notes, top_n: int, index_version=None):
+        """
+        Return (notes, meta): the top_n notes by cross-encoder score (each
+        with a "rerank_score"), or the first top_n in retrieval order if
+        scoring timed out.
+        """
+        self.load()
+        t0 = time.perf_counter()
+        candidates = [((index_version, query, n["chunk_id"]), n) for n in notes[:CANDIDATES]]
+        cached = self._cached([key for key, _ in candidates])
+        budgeted = self._budget(candidates, cached)
+        # Always score at least top_n, even when that exceeds the budget
+        if len(budgeted) < min(top_n, len(candidates)):
+            budgeted = candidates[:top_n]
+
+        todo = [(key, n) for key, n in budgeted if key not in cached]
+        meta = {
+            "candidates": len(notes),
+            "scored": len(todo),
+            "cache_hits": len(budgeted) - len(todo),
+            "trimmed": len(candidates) - len(budgeted),
+            "timed_out": False,
+        }
+
+        scores = dict(cached)
+        if todo:
+            future = self._pool.submit(self._predict, query, [n for _, n in todo], [k for k, _ in todo])
+            try:
+                scores.update(future.result(timeout=MAX_MS / 1000))
+            except FutureTimeout:
+                # Assume at least twice the cap until the late result reports the real cost
+                with self._lock:
+                    self.ms_per_pair = max(self.ms_per_pair or 0.0, 2 * MAX_MS / len(todo))
+                meta["timed_out"] = True
+                meta["rerank_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+                return list(notes[:top_n]), meta
+
+        ranked = sorted(budgeted, key=lambda kn: scores[kn[0]], reverse=True)
+        out = [{**n, "rerank_score": round(scores[key], 4)} for key, n in ranked[:top_n]]
+        meta["rerank_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        return out, meta
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> Reranker:
+    """Process-wide re-ranker (model loaded on first use)."""
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = Reranker()
+    return _reranker
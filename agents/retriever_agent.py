@@ -1,7 +1,18 @@
 from agents.state import AgentState, add_trace
-from agents.rag_retrieve import retrieve_notes
+from agents.rag_retrieve import get_engine
+from agents import reranker
+from agents.timing import span
+import asyncio
 import re
 
+MIN_SCORE = 0.60
+# Top BM25 hits are kept below MIN_SCORE: exact-term matches (codes,
+# acronyms) often have a low cosine, and BM25-only hits have none. They
+# must still cover most of the query, so a chunk sharing one common word
+# with an off-topic question does not count as evidence.
+SPARSE_MAX_RANK = 3
+MIN_SPARSE_COVERAGE = 0.60
+
 # Detect vague / underspecified prompts
 _GENERIC = re.compile(r"\b(compare|two|risk|risks|list|top|tell|explain|what|why|how)\b", re.I)
 
@@ -13,24 +24,31 @@ def _is_too_vague(q: str) -> bool:
     return generic_hits >= max(2, len(q.split()) // 2)
 
 
-def run(state: AgentState) -> AgentState:
-    query = (state.get("retrieval_query") or "").strip()
-    top_k = int(state.get("top_k", 5))
+def _empty_query(state: AgentState, query: str, top_k: int) -> AgentState:
+    state["notes"] = []
+    add_trace(
+        state,
+        agent="retriever",
+        action="retrieve",
+        detail="Empty retrieval query; returned 0 notes",
+        meta={"query": query, "top_k": top_k, "notes": 0},
+    )
+    return state
 
-    if not query:
-        state["notes"] = []
-        add_trace(
-            state,
-            agent="retriever",
-            action="retrieve",
-            detail="Empty retrieval query; returned 0 notes",
-            meta={"query": query, "top_k": top_k, "notes": 0},
-        )
-        return state
 
-    MIN_SCORE = 0.60
-    notes = retrieve_notes(query=query, top_k=top_k)
-    notes = [n for n in notes if float(n.get("score", 0) or 0) >= MIN_SCORE]
+def _relevant(note) -> bool:
+    if float(note.get("score") or 0) >= MIN_SCORE:
+        return True
+    return (
+        note.get("sparse_rank") is not None
+        and note["sparse_rank"] <= SPARSE_MAX_RANK
+        and note.get("sparse_coverage", 0) >= MIN_SPARSE_COVERAGE
+    )
+
+
+def _apply_notes(state: AgentState, query: str, top_k: int, notes, timings, index_load_ms) -> AgentState:
+    candidates = len(notes)
+    notes = [n for n in notes if _relevant(n)]
     state["notes"] = notes
 
     # No evidence
@@ -40,7 +58,8 @@ def run(state: AgentState) -> AgentState:
             agent="retriever",
             action="no_evidence",
             detail="No relevant sources after score threshold; stopping",
-            meta={"query": query, "top_k": top_k, "min_score": MIN_SCORE},
+            meta={"query": query, "top_k": top_k, "candidates": candidates, "min_score": MIN_SCORE,
+                  "min_sparse_coverage": MIN_SPARSE_COVERAGE, **timings},
         )
 
         state["notes"] = []
@@ -66,7 +85,83 @@ def run(state: AgentState) -> AgentState:
         agent="retriever",
         action="retrieve",
         detail="Retrieved notes from FAISS",
-        meta={"query": query, "top_k": top_k, "notes": len(notes)},
+        meta={
+            "query": query,
+            "top_k": top_k,
+            # Over-fetched for re-ranking, which then keeps the top_k of
+            # those above the threshold; without it candidates <= top_k
+            "candidates": candidates,
+            "above_threshold": len(notes),
+            "notes": min(len(notes), top_k),
+            "index_load_ms": index_load_ms,
+            **timings,
+        },
     )
 
     return state
+
+
+def _fetch_k(top_k: int) -> int:
+    # Over-fetch so the cross-encoder has candidates to choose from
+    return max(top_k, reranker.CANDIDATES) if reranker.is_enabled() else top_k
+
+
+def _rerank(state: AgentState, query: str, top_k: int, index_version) -> AgentState:
+    """Keep the top_k candidates by cross-encoder score (RERANK=1)."""
+    with span(state, "reranker", parent="retriever"):
+        rr = reranker.get_reranker()
+        notes, meta = rr.rerank(query, state["notes"], top_k, index_version)
+        state["notes"] = notes
+        add_trace(
+            state,
+            agent="retriever",
+            action="rerank",
+            detail=f"Re-ranked {meta['candidates']} candidates, kept {len(notes)}",
+            meta={"model": rr.model_name, "kept": len(notes), "max_ms": reranker.MAX_MS, **meta},
+        )
+    return state
+
+
+def fetch_candidates(query: str, top_k: int):
+    """Return (notes, timings) for the query, over-fetched when re-ranking is on."""
+    return get_engine().search(query, _fetch_k(top_k))
+
+
+def _take_prefetched(state: AgentState, query: str):
+    """Notes already retrieved for this exact query by a speculative rewrite, if any."""
+    prefetched = state.get("prefetched")
+    state["prefetched"] = None
+    if prefetched and prefetched["query"] == query:
+        return prefetched["notes"], {**prefetched["timings"], "prefetched": True}
+    return None
+
+
+def run(state: AgentState) -> AgentState:
+    query = (state.get("retrieval_query") or "").strip()
+    top_k = int(state.get("top_k", 5))
+
+    if not query:
+        return _empty_query(state, query, top_k)
+
+    engine = get_engine()
+    notes, timings = _take_prefetched(state, query) or fetch_candidates(query, top_k)
+    state = _apply_notes(state, query, top_k, notes, timings, engine.load_ms)
+    if reranker.is_enabled() and state["notes"]:
+        state = _rerank(state, query, top_k, engine.index_version)
+    return state
+
+
+async def arun(state: AgentState) -> AgentState:
+    """Async variant: embedding, search and re-ranking run in a worker thread."""
+    query = (state.get("retrieval_query") or "").strip()
+    top_k = int(state.get("top_k", 5))
+
+    if not query:
+        return _empty_query(state, query, top_k)
+
+    engine = get_engine()
+    notes, timings = _take_prefetched(state, query) or await asyncio.to_thread(fetch_candidates, query, top_k)
+    state = _apply_notes(state, query, top_k, notes, timings, engine.load_ms)
+    if reranker.is_enabled() and state["notes"]:
+        state = await asyncio.to_thread(_rerank, state, query, top_k, engine.index_version)
+    return state
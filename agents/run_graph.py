@@ -1,15 +1,33 @@
-from agents.graph import run
+from agents.graph import run_stream, warm_up
 
 
 def main():
+    warm_up()
+
     task = input("Enter task: ").strip()
     if not task:
         return
 
-    out = run(task=task, top_k=5)
-
     print("\n=== DRAFT ===\n")
-    print(out.get("final") or out.get("draft", ""))
+    streamed = ""
+    out = {}
+    for event in run_stream(task=task, top_k=5):
+        if event["type"] == "token":
+            streamed += event["text"]
+            print(event["text"], end="", flush=True)
+        elif event["type"] == "retry":
+            streamed = ""
+            print("\n\n[verifier] citations incomplete; retrying with a rewritten query\n", flush=True)
+        elif event["type"] == "final":
+            out = event["state"]
+
+    final = out.get("final") or out.get("draft", "")
+    if final.strip() != streamed.strip():
+        # Cache hit, guardrails block or verifier override
+        print("\n\n=== FINAL ===\n")
+        print(final)
+
+    print(f"\n\nTTFT: {out.get('ttft_ms')} ms | total: {out.get('latency_ms')} ms")
 
     print("\n=== TRACE ===")
     for e in out.get("trace", []):
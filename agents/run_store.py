@@ -0,0 +1,253 @@
+import os
+import sys
+import gzip
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+LOG_DIR = Path("logs")
+RUN_STORE_PATH = LOG_DIR / "runs.sqlite"
+
+
+def is_enabled() -> bool:
+    return os.getenv("RUN_STORE", "0") == "1"
+
+
+def _epoch(timestamp_utc) -> float:
+    try:
+        return datetime.fromisoformat(str(timestamp_utc)).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def p95_rank(n: int) -> int:
+    """1-based nearest-rank position of the p95 among n sorted values: ceil(0.95 * n)."""
+    return (95 * n + 99) // 100  # integer arithmetic; 0.95 * n can land just off a whole number
+
+
+def nearest_rank_p95(values):
+    """p95 of values by the nearest-rank definition node_latency() uses (None if empty)."""
+    values = sorted(values)
+    return values[p95_rank(len(values)) - 1] if values else None
+
+
+def _has_event(trace, agent: str, action: str) -> bool:
+    return any(e.get("agent") == agent and e.get("action") == action for e in (trace or []))
+
+
+class RunStore:
+    """
+    Indexed copy of the run log for dashboard queries. Summary columns live
+    in `runs` (covering index on ts), per-node timings in `run_nodes`, and
+    the bulky trace/notes/spans in `run_details`, read only per run.
+    A run is identified by (timestamp_utc, task), so re-importing a log
+    that is already stored adds nothing.
+    """
+
+    def __init__(self, path: Path = RUN_STORE_PATH, readonly: bool = False):
+        self.path = Path(path)
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            # Dashboard readers must not block the log writer
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " id INTEGER PRIMARY KEY, ts REAL NOT NULL, timestamp_utc TEXT, task TEXT, final_preview TEXT,"
+                " latency_ms REAL, ttft_ms REAL, blocked INTEGER NOT NULL, retried INTEGER NOT NULL,"
+                " no_evidence INTEGER NOT NULL, answer_cache TEXT);"
+                "CREATE INDEX IF NOT EXISTS runs_ts ON runs (ts, latency_ms, blocked, retried, no_evidence);"
+                "CREATE TABLE IF NOT EXISTS run_nodes ("
+                " run_id INTEGER NOT NULL, ts REAL NOT NULL, node TEXT NOT NULL, ms REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS run_nodes_node_ts ON run_nodes (node, ts, ms);"
+                "CREATE TABLE IF NOT EXISTS run_details ("
+                " run_id INTEGER PRIMARY KEY, final TEXT, trace TEXT, notes TEXT, spans TEXT);"
+            )
+            self._create_run_key()
+        self._lock = threading.Lock()
+
+    def _create_run_key(self) -> None:
+        try:
+            self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS runs_key ON runs (timestamp_utc, task)")
+        except sqlite3.IntegrityError:
+            # Store written before runs had a key: drop the duplicate imports first
+            with self.conn:
+                self.conn.execute(
+                    "DELETE FROM runs WHERE id NOT IN (SELECT MIN(id) FROM runs GROUP BY timestamp_utc, task)"
+                )
+                self.conn.execute("DELETE FROM run_nodes WHERE run_id NOT IN (SELECT id FROM runs)")
+                self.conn.execute("DELETE FROM run_details WHERE run_id NOT IN (SELECT id FROM runs)")
+            self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS runs_key ON runs (timestamp_utc, task)")
+
+    # -----------------------------------------------------------------
+    # Writes
+    # -----------------------------------------------------------------
+
+    def insert_many(self, records) -> int:
+        """
+        Insert persistence snapshots (see persistence._safe_state_snapshot);
+        runs already in the store are skipped. Returns the number inserted.
+        """
+        inserted = 0
+        with self._lock:
+            with self.conn:
+                for r in records:
+                    trace = r.get("trace") or []
+                    ts = _epoch(r.get("timestamp_utc"))
+                    cur = self.conn.execute(
+                        "INSERT OR IGNORE INTO runs (ts, timestamp_utc, task, final_preview, latency_ms, ttft_ms,"
+                        " blocked, retried, no_evidence, answer_cache) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            ts,
+                            r.get("timestamp_utc"),
+                            r.get("task"),
+                            str(r.get("final") or "")[:200],
+                            r.get("latency_ms"),
+                            r.get("ttft_ms"),
+                            int(_has_event(trace, "guardrails", "blocked")),
+                            int(bool(r.get("retried"))),
+                            int(_has_event(trace, "retriever", "no_evidence")),
+                            r.get("answer_cache"),
+                        ),
+                    )
+                    if cur.rowcount == 0:
+                        continue
+                    inserted += 1
+                    run_id = cur.lastrowid
+                    self.conn.executemany(
+                        "INSERT INTO run_nodes VALUES (?, ?, ?, ?)",
+                        [(run_id, ts, node, ms) for node, ms in (r.get("node_ms") or {}).items()],
+                    )
+                    self.conn.execute(
+                        "INSERT INTO run_details VALUES (?, ?, ?, ?, ?)",
+                        (
+                            run_id,
+                            r.get("final"),
+                            json.dumps(trace, ensure_ascii=False),
+                            json.dumps(r.get("notes") or [], ensure_ascii=False),
+                            json.dumps(r.get("spans") or [], ensure_ascii=False),
+                        ),
+                    )
+        return inserted
+
+    def import_jsonl(self, path) -> int:
+        """Backfill from a runs.jsonl file (or a rotated .jsonl.gz); returns the number of new runs."""
+        batch, n = [], 0
+        opener = gzip.open if str(path).endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                batch.append(json.loads(line))
+                if len(batch) >= 1000:
+                    n += self.insert_many(batch)
+                    batch = []
+        return n + self.insert_many(batch)
+
+    # -----------------------------------------------------------------
+    # Aggregate queries (all bounded by ts, served from the indexes)
+    # -----------------------------------------------------------------
+
+    @staticmethod
+    def _range(since, until):
+        return (since if since is not None else float("-inf"), until if until is not None else float("inf"))
+
+    def kpis(self, since=None, until=None) -> dict:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*), AVG(blocked), AVG(retried), AVG(no_evidence), AVG(latency_ms)"
+                " FROM runs WHERE ts BETWEEN ? AND ?",
+                self._range(since, until),
+            ).fetchone()
+        total, blocked, retried, no_evidence, latency = row
+        return {
+            "total": total,
+            "blocked_rate": blocked or 0.0,
+            "retry_rate": retried or 0.0,
+            "no_evidence_rate": no_evidence or 0.0,
+            "avg_latency_ms": latency,
+        }
+
+    def runs_per_day(self, since=None, until=None):
+        with self._lock:
+            return self.conn.execute(
+                "SELECT date(ts, 'unixepoch') AS day, COUNT(*) FROM runs"
+                " WHERE ts BETWEEN ? AND ? GROUP BY day ORDER BY day",
+                self._range(since, until),
+            ).fetchall()
+
+    def node_latency(self, since=None, until=None):
+        """[{node, runs, mean_ms, p95_ms}] for the time range."""
+        # One pass over the (node, ts, ms) index; the window functions rank
+        # each node's timings and pick the p95 row in the same query
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT node, n, mean_ms, ms FROM ("
+                " SELECT node, ms, ROW_NUMBER() OVER (PARTITION BY node ORDER BY ms) AS rank,"
+                " COUNT(*) OVER (PARTITION BY node) AS n, AVG(ms) OVER (PARTITION BY node) AS mean_ms"
+                " FROM run_nodes WHERE ts BETWEEN ? AND ?)"
+                " WHERE rank = (95 * n + 99) / 100 ORDER BY node",  # p95_rank(n)
+                self._range(since, until),
+            ).fetchall()
+        return [{"node": node, "runs": n, "mean_ms": mean, "p95_ms": p95} for node, n, mean, p95 in rows]
+
+    def recent(self, since=None, until=None, limit: int = 500):
+        with self._lock:
+            cur = self.conn.execute(
+                "SELECT id, timestamp_utc, latency_ms, task, blocked, retried, final_preview FROM runs"
+                " WHERE ts BETWEEN ? AND ? ORDER BY ts DESC LIMIT ?",
+                (*self._range(since, until), limit),
+            )
+            cols = [c[0] for c in cur.description]
+            return [dict(zip(cols, row)) for row in cur]
+
+    def details(self, run_id: int) -> dict:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT final, trace, notes, spans FROM run_details WHERE run_id = ?", (int(run_id),)
+            ).fetchone()
+        if row is None:
+            return {}
+        final, trace, notes, spans = row
+        return {"final": final, "trace": json.loads(trace), "notes": json.loads(notes), "spans": json.loads(spans)}
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_run_store() -> RunStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RunStore()
+    return _store
+
+
+def _log_files():
+    """Rotated logs (plain or gzipped) followed by the active runs.jsonl."""
+    rotated = sorted(LOG_DIR.glob("runs-*.jsonl")) + sorted(LOG_DIR.glob("runs-*.jsonl.gz"))
+    active = LOG_DIR / "runs.jsonl"
+    return rotated + ([active] if active.exists() else [])
+
+
+def main(argv=None):
+    """Backfill: python -m agents.run_store [logs/runs.jsonl ...] (default: all of logs/)"""
+    argv = sys.argv[1:] if argv is None else argv
+    store = RunStore()
+    for src in argv or _log_files():
+        n = store.import_jsonl(src)
+        print(f"Imported {n} new runs from {src} into {RUN_STORE_PATH}")
+
+
+if __name__ == "__main__":
+    main()
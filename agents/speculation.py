@@ -0,0 +1,148 @@
+import os
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agents.state import AgentState, add_trace
+from agents.metrics import REGISTRY
+from agents.query_rewriter_agent import run as rewrite_query, arun as arewrite_query, apply_query
+from agents.retriever_agent import fetch_candidates
+
+_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculate")
+
+
+def is_enabled() -> bool:
+    return os.getenv("SPECULATIVE_REWRITE", "0") == "1"
+
+
+def retrieval_enabled() -> bool:
+    return os.getenv("SPECULATIVE_RETRIEVAL", "1") == "1"
+
+
+def _snapshot(state: AgentState) -> AgentState:
+    # No draft yet, so the rewrite prompt has no draft excerpt
+    return {
+        "task": state.get("task", ""),
+        "retrieval_query": state.get("retrieval_query", state.get("task", "")),
+        "deliverable_sections": list(state.get("deliverable_sections") or []),
+        "top_k": state.get("top_k", 5),
+        "trace": [],
+    }
+
+
+def _result(snapshot: AgentState, t0: float, t1: float, notes=None, timings=None, t2=None) -> dict:
+    out = {
+        "query": snapshot["retrieval_query"],
+        "rewrite_ms": round((t1 - t0) * 1000, 2),
+        "llm_cache": (snapshot.get("llm_cache") or {}).get("query_rewriter") or {},
+    }
+    if notes is not None:
+        out.update({"notes": notes, "timings": timings, "retrieve_ms": round((t2 - t1) * 1000, 2)})
+    return out
+
+
+def _speculate(snapshot: AgentState) -> dict:
+    t0 = time.perf_counter()
+    rewrite_query(snapshot)
+    t1 = time.perf_counter()
+    if not retrieval_enabled():
+        return _result(snapshot, t0, t1)
+    notes, timings = fetch_candidates(snapshot["retrieval_query"], int(snapshot["top_k"]))
+    return _result(snapshot, t0, t1, notes, timings, time.perf_counter())
+
+
+async def _aspeculate(snapshot: AgentState) -> dict:
+    t0 = time.perf_counter()
+    await arewrite_query(snapshot)
+    t1 = time.perf_counter()
+    if not retrieval_enabled():
+        return _result(snapshot, t0, t1)
+    notes, timings = await asyncio.to_thread(fetch_candidates, snapshot["retrieval_query"], int(snapshot["top_k"]))
+    return _result(snapshot, t0, t1, notes, timings, time.perf_counter())
+
+
+# ---------------------------------------------------------------------
+# Start (writer node) / settle (verifier)
+# ---------------------------------------------------------------------
+
+def start(state: AgentState) -> None:
+    """Begin rewriting the query in a worker thread while the first writer call runs."""
+    state["speculation"] = None
+    if is_enabled() and not state.get("retried"):
+        state["speculation"] = _pool.submit(_speculate, _snapshot(state))
+
+
+def astart(state: AgentState) -> None:
+    """Async variant of start(): the rewrite runs as a task on the running loop."""
+    state["speculation"] = None
+    if is_enabled() and not state.get("retried"):
+        state["speculation"] = asyncio.ensure_future(_aspeculate(_snapshot(state)))
+
+
+def _apply(state: AgentState, result: dict, wait_ms: float) -> None:
+    counters = state.setdefault("llm_cache", {}).setdefault("query_rewriter", {"hits": 0, "misses": 0})
+    for k, v in result["llm_cache"].items():
+        counters[k] = counters.get(k, 0) + v
+
+    # Sequentially the verifier would have paid the rewrite, and the retriever the search
+    saved_ms = result["rewrite_ms"] + result.get("retrieve_ms", 0.0) - wait_ms
+    if "notes" in result:
+        state["prefetched"] = {"query": result["query"], "notes": result["notes"], "timings": result["timings"]}
+    apply_query(state, result["query"], meta={
+        "speculative": True,
+        "rewrite_ms": result["rewrite_ms"],
+        "retrieve_ms": result.get("retrieve_ms"),
+        "wait_ms": round(wait_ms, 2),
+        "saved_ms": round(saved_ms, 2),
+    })
+    REGISTRY.inc("rag_speculation_total", outcome="used")
+
+
+def _failed(state: AgentState, error: BaseException) -> None:
+    REGISTRY.inc("rag_speculation_total", outcome="failed")
+    add_trace(state, "query_rewriter", "speculation_failed",
+              "Speculative rewrite failed; rewriting synchronously", meta={"error": repr(error)})
+
+
+def use(state: AgentState, spec) -> bool:
+    """Apply a finished (or nearly finished) speculative rewrite. False if there is none to use."""
+    state["speculation"] = None
+    if spec is None:
+        return False
+    t0 = time.perf_counter()
+    try:
+        result = spec.result()
+    except Exception as e:
+        _failed(state, e)
+        return False
+    _apply(state, result, (time.perf_counter() - t0) * 1000)
+    return True
+
+
+async def ause(state: AgentState, spec) -> bool:
+    state["speculation"] = None
+    if spec is None:
+        return False
+    t0 = time.perf_counter()
+    try:
+        result = await spec
+    except Exception as e:
+        _failed(state, e)
+        return False
+    _apply(state, result, (time.perf_counter() - t0) * 1000)
+    return True
+
+
+def discard(state: AgentState, spec) -> None:
+    """Verification passed: drop the speculative rewrite (cancelled if it has not finished)."""
+    state["speculation"] = None
+    if spec is None:
+        return
+    done = spec.done()
+    if not done:
+        spec.cancel()
+    elif not spec.cancelled():
+        spec.exception()  # a failed speculation is irrelevant now; mark it retrieved
+    REGISTRY.inc("rag_speculation_total", outcome="discarded")
+    add_trace(state, "query_rewriter", "speculation_discarded",
+              "Verification passed; discarded speculative rewrite", meta={"finished": done})
@@ -1,4 +1,4 @@
-from typing import TypedDict, List, Dict, Any
+from typing import TypedDict, List, Dict, Any, Optional
 
 
 class TraceEvent(TypedDict, total=False):
@@ -9,9 +9,10 @@ class TraceEvent(TypedDict, total=False):
 
 
 class RAGNote(TypedDict):
+    chunk_id: int
     text: str
     citation: Dict[str, Any]
-    score: float
+    score: Optional[float]  # dense cosine; None for chunks only BM25 found
 
 
 class AgentState(TypedDict, total=False):
@@ -27,6 +28,12 @@ class AgentState(TypedDict, total=False):
 
     # writer outputs
     draft: str
+    paragraph_checks: List[Dict[str, Any]]
+
+    # speculative rewrite started with the writer (Future/Task) and the
+    # retrieval it prefetched for the rewritten query
+    speculation: Any
+    prefetched: Dict[str, Any]
 
     # verifier outputs later
     final: str
@@ -39,6 +46,23 @@ class AgentState(TypedDict, total=False):
     #early stopping
     stop: bool
 
+    # answer cache lookup result (status, similarity, ...)
+    answer_cache: Dict[str, Any]
+    # normalized question embedding computed on an exact cache miss
+    query_embedding: Any
+
+    # completion cache hits/misses per node
+    llm_cache: Dict[str, Dict[str, int]]
+
+    # set by graph.run_stream(); the writer streams tokens when true
+    stream: bool
+    ttft_ms: float
+
+    # timing spans per node execution and wall time per node (ms), summed over retries
+    run_start: float
+    spans: List[Dict[str, Any]]
+    node_ms: Dict[str, float]
+
     latency_ms: float
 
 
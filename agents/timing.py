@@ -0,0 +1,49 @@
+import time
+from contextlib import contextmanager
+
+from agents.metrics import observe_node
+from agents.state import AgentState
+
+
+def _offset_ms(state: AgentState, t: float) -> float:
+    return round((t - state.get("run_start", t)) * 1000, 2)
+
+
+@contextmanager
+def span(state: AgentState, name: str, parent: str = None):
+    """
+    Time the enclosed block as one span of `name`. The span (start/end
+    relative to the run start, duration, retry iteration) is appended to
+    state["spans"], added to state["node_ms"], and attached to the meta of
+    the last trace event written inside the block that is not already
+    covered by a nested span.
+    """
+    t0 = time.perf_counter()
+    state.setdefault("run_start", t0)
+    first_event = len(state.get("trace") or [])
+
+    yield
+
+    t1 = time.perf_counter()
+    spans = state.setdefault("spans", [])
+    record = {
+        "node": name,
+        "iteration": sum(1 for s in spans if s["node"] == name),
+        "start_ms": _offset_ms(state, t0),
+        "end_ms": _offset_ms(state, t1),
+        "duration_ms": round((t1 - t0) * 1000, 2),
+    }
+    if parent:
+        record["parent"] = parent
+    spans.append(record)
+
+    # A parent's total includes its nested spans (verifier includes query_rewriter)
+    node_ms = state.setdefault("node_ms", {})
+    node_ms[name] = round(node_ms.get(name, 0.0) + record["duration_ms"], 2)
+    observe_node(name, record["duration_ms"])
+
+    for event in reversed((state.get("trace") or [])[first_event:]):
+        meta = event.setdefault("meta", {})
+        if "span" not in meta:
+            meta["span"] = record
+            break
@@ -1,6 +1,11 @@
 import re
+from langgraph.config import get_stream_writer
+
 from agents.state import AgentState, add_trace
+from agents.timing import span
+from agents import speculation
 from agents.query_rewriter_agent import run as rewrite_query
+from agents.query_rewriter_agent import arun as arewrite_query
 
 SECRET_PATTERNS = [
     r"OPENAI_API_KEY\s*=\s*\S+",
@@ -20,7 +25,7 @@ def _redact_secrets(text: str) -> str:
 CITATION_RE = re.compile(r"\[(\d+)\]")
 
 
-def _split_body_and_sources(text: str):
+def split_body_and_sources(text: str):
     marker_patterns = ["\n### Sources", "\n## Sources", "\n# Sources"]
     for m in marker_patterns:
         idx = text.find(m)
@@ -71,7 +76,25 @@ def _needs_citation(p: str) -> bool:
     return True
 
 
-def run(state: AgentState) -> AgentState:
+def check_paragraph(p: str, max_n: int) -> dict:
+    """
+    Citation checks for one body paragraph. The streaming writer runs this
+    as each paragraph completes; _verify() reuses the results.
+    """
+    nums = [int(m.group(1)) for m in CITATION_RE.finditer(p)]
+    return {
+        "text": p,
+        "needs_citation": _needs_citation(p) and ("Not found in the sources." not in p),
+        "has_citation": bool(nums),
+        "out_of_range": [n for n in nums if not 1 <= n <= max_n],
+    }
+
+
+def _verify(state: AgentState) -> bool:
+    """
+    Check grounding/citations and set final or the retry flags.
+    Returns True when a retry (query rewrite + re-retrieval) is needed.
+    """
     draft = state.get("draft", "")
 
     # Output guardrail: redact secrets before anything else
@@ -93,16 +116,19 @@ def run(state: AgentState) -> AgentState:
         state["final"] = "No supported answer could be found in the current document set. Please rephrase your request."
         state["needs_retry"] = False
         add_trace(state, "verifier", "verify", "Empty draft; set final to not found")
-        return state
+        return False
 
-    body, sources_appendix = _split_body_and_sources(draft)
+    body, sources_appendix = split_body_and_sources(draft)
     paras = _paragraphs(body)
 
+    # Paragraphs already checked while the draft was streaming
+    checked = {c["text"]: c for c in state.get("paragraph_checks") or []}
+    checks = [checked.get(p) or check_paragraph(p, max_n) for p in paras]
+    reused = sum(p in checked for p in paras)
+
     missing_citation = [
-        p for p in paras
-        if _needs_citation(p)
-        and ("Not found in the sources." not in p)
-        and (not _has_citation(p))
+        c["text"] for c in checks
+        if c["needs_citation"] and not c["has_citation"]
     ]
 
     citations_ok = _citations_in_range(draft, max_n) if max_n > 0 else False
@@ -118,6 +144,7 @@ def run(state: AgentState) -> AgentState:
             "citations_in_range": citations_ok,
             "notes_available": max_n,
             "has_sources_appendix": bool(sources_appendix),
+            "paragraphs_checked_while_streaming": reused,
         },
     )
 
@@ -125,17 +152,7 @@ def run(state: AgentState) -> AgentState:
     if (missing_citation or not citations_ok) and not state.get("retried", False):
         state["retried"] = True
         state["needs_retry"] = True
-
-        rewrite_query(state)
-
-        add_trace(
-            state,
-            "verifier",
-            "retry_requested",
-            "Grounding failed; requesting one retry",
-            meta={"new_query": state.get("retrieval_query", "")},
-        )
-        return state
+        return True
 
     # --- Strict enforcement after retry ---
     # Block if citations are invalid/out of range (hard failure)
@@ -154,7 +171,7 @@ def run(state: AgentState) -> AgentState:
                 "citations_in_range": citations_ok,
             },
         )
-        return state
+        return False
 
     # Block only if too many paragraphs are ungrounded (hard failure)
     if len(missing_citation) >= 2:
@@ -172,7 +189,7 @@ def run(state: AgentState) -> AgentState:
                 "citations_in_range": citations_ok,
             },
         )
-        return state
+        return False
 
     state["final"] = draft
     state["needs_retry"] = False
@@ -188,4 +205,42 @@ def run(state: AgentState) -> AgentState:
     else:
         add_trace(state, "verifier", "finalized", "Answer finalized after strict grounding")
 
+    return False
+
+
+def _trace_retry(state: AgentState) -> None:
+    if state.get("stream"):
+        # Streaming clients discard the draft they have shown so far
+        get_stream_writer()({"type": "retry", "new_query": state.get("retrieval_query", "")})
+    add_trace(
+        state,
+        "verifier",
+        "retry_requested",
+        "Grounding failed; requesting one retry",
+        meta={"new_query": state.get("retrieval_query", "")},
+    )
+
+
+def run(state: AgentState) -> AgentState:
+    spec = state.get("speculation")
+    if _verify(state):
+        with span(state, "query_rewriter", parent="verifier"):
+            # A speculative rewrite started with the writer is usually done by now
+            if not speculation.use(state, spec):
+                rewrite_query(state)
+        _trace_retry(state)
+    else:
+        speculation.discard(state, spec)
+    return state
+
+
+async def arun(state: AgentState) -> AgentState:
+    spec = state.get("speculation")
+    if _verify(state):
+        with span(state, "query_rewriter", parent="verifier"):
+            if not await speculation.ause(state, spec):
+                await arewrite_query(state)
+        _trace_retry(state)
+    else:
+        speculation.discard(state, spec)
     return state
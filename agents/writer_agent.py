@@ -1,11 +1,16 @@
 import os
+import time
 from dotenv import load_dotenv
-from openai import OpenAI
+from langgraph.config import get_stream_writer
+from openai import AsyncOpenAI, OpenAI
 
 from agents.state import AgentState, add_trace
+from agents.llm_cache import acomplete, complete, node_counters, stream_complete
+from agents.verifier_agent import check_paragraph, split_body_and_sources
 
 load_dotenv()
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+aclient = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 
 def _format_sources_for_context(notes):
@@ -27,19 +32,18 @@ def _format_sources_list(notes):
 
 
 
-def run(state: AgentState) -> AgentState:
-    if not os.getenv("OPENAI_API_KEY"):
-        raise RuntimeError("Missing OPENAI_API_KEY. Add it to .env (never commit it).")
+def _no_notes(state: AgentState) -> AgentState:
+    state["draft"] = "Not found in the sources."
+    add_trace(state, "writer", "draft", "No notes returned; wrote not-found response")
+    return state
 
+
+def _build_prompt(state: AgentState):
+    """Return (system, user, temperature) for the writer call."""
     task = state.get("task", "").strip()
     sections = state.get("deliverable_sections", [])
     notes = state.get("notes", [])
 
-    if not notes:
-        state["draft"] = "Not found in the sources."
-        add_trace(state, "writer", "draft", "No notes returned; wrote not-found response")
-        return state
-
     sources_block = _format_sources_for_context(notes)
 
     system = (
@@ -71,27 +75,122 @@ def run(state: AgentState) -> AgentState:
     )
 
     temp = 0 if os.getenv("EVAL_MODE") == "1" else 0.2
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user},
-        ],
-        temperature=temp,
-    )
+    return system, user, temp
 
-    draft = (resp.choices[0].message.content or "").strip()
 
+def _apply_draft(state: AgentState, draft: str, meta=None) -> AgentState:
     # Append sources mapping
     # draft = draft + "\n\n" + _format_sources_list(notes)
 
-    state["draft"] = draft
+    state["draft"] = draft.strip()
 
     add_trace(
         state,
         agent="writer",
         action="draft",
         detail="Generated deliverable draft from notes (with Sources list appended)",
-        meta={"notes_used": len(notes), "sections": sections},
+        meta={
+            "notes_used": len(state.get("notes", [])),
+            "sections": state.get("deliverable_sections", []),
+            "llm_cache": node_counters(state, "writer"),
+            **(meta or {}),
+        },
     )
     return state
+
+
+def run(state: AgentState) -> AgentState:
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("Missing OPENAI_API_KEY. Add it to .env (never commit it).")
+
+    if not state.get("notes", []):
+        return _no_notes(state)
+
+    system, user, temp = _build_prompt(state)
+    draft = complete(state, "writer", client, "gpt-4o-mini", temp, system, user)
+    return _apply_draft(state, draft)
+
+
+async def arun(state: AgentState) -> AgentState:
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("Missing OPENAI_API_KEY. Add it to .env (never commit it).")
+
+    if not state.get("notes", []):
+        return _no_notes(state)
+
+    system, user, temp = _build_prompt(state)
+    draft = await acomplete(state, "writer", aclient, "gpt-4o-mini", temp, system, user)
+    return _apply_draft(state, draft)
+
+
+def run_stream(state: AgentState) -> AgentState:
+    """
+    Streaming variant of run(): tokens are pushed to the graph's custom
+    stream as they arrive, and every completed body paragraph is checked
+    for citations right away so the verifier does not redo that work.
+    A paragraph citing a source number that does not exist fails
+    verification whatever follows, so generation stops there and the
+    verifier can start its retry without waiting for the rest.
+    """
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("Missing OPENAI_API_KEY. Add it to .env (never commit it).")
+
+    if not state.get("notes", []):
+        return _no_notes(state)
+
+    emit = get_stream_writer()
+    max_n = len(state.get("notes", []))
+    checks = []
+    in_sources = False
+    first = True
+
+    def check(paragraph: str) -> bool:
+        """Check one finished paragraph; False once the draft cannot pass verification."""
+        nonlocal in_sources, first
+        if in_sources:
+            return True
+        # Same split as the verifier (a Sources heading after a newline), so
+        # both agree where the appendix starts
+        body, appendix = split_body_and_sources(paragraph if first else "\n" + paragraph)
+        first = False
+        in_sources = bool(appendix)
+        if body:
+            checks.append(check_paragraph(body, max_n))
+            return not checks[-1]["out_of_range"]
+        return True
+
+    system, user, temp = _build_prompt(state)
+    t0 = time.perf_counter()
+    first_token_ms = None
+    parts = []
+    pending = ""
+    stopped = None
+
+    deltas = stream_complete(state, "writer", client, "gpt-4o-mini", temp, system, user)
+    for delta in deltas:
+        if first_token_ms is None:
+            first_token_ms = round((time.perf_counter() - t0) * 1000, 2)
+        parts.append(delta)
+        emit({"type": "token", "text": delta})
+
+        pending += delta
+        while "\n\n" in pending:
+            paragraph, pending = pending.split("\n\n", 1)
+            if not check(paragraph):
+                stopped = checks[-1]["out_of_range"]
+                break
+        if stopped:
+            deltas.close()
+            break
+    else:
+        check(pending)
+
+    state["paragraph_checks"] = checks
+    meta = {
+        "streamed": True,
+        "first_token_ms": first_token_ms,
+        "generation_ms": round((time.perf_counter() - t0) * 1000, 2),
+    }
+    if stopped:
+        meta["stopped_out_of_range"] = stopped
+    return _apply_draft(state, "".join(parts), meta=meta)
@@ -1,8 +1,14 @@
 import os
+import glob
+import gzip
 import json
+import time
+import threading
 import pandas as pd
 import streamlit as st
 
+from agents.run_store import RunStore, is_enabled as run_store_enabled, nearest_rank_p95
+
 
 def _is_blocked(trace_list) -> bool:
     try:
@@ -14,115 +20,345 @@ def _is_blocked(trace_list) -> bool:
         return False
 
 
-def render_dashboard(ROOT_DIR: str):
-    st.subheader("Observability")
+def _preview(text, n: int = 80) -> str:
+    return str(text or "").replace("\n", " ")[:n]
 
-    log_file = os.path.join(ROOT_DIR, "logs", "runs.jsonl")
-    if not os.path.exists(log_file):
-        st.info("No runs logged yet. Ask a few questions first.")
-        return
 
-    # Read JSONL
+def _summarize(rec: dict, path: str, offset: int, length: int) -> dict:
+    """Derived columns for one record; trace and notes are not kept."""
+    return {
+        "_file": path,
+        "_offset": offset,
+        "_length": length,
+        "timestamp_utc": rec.get("timestamp_utc"),
+        "task_preview": _preview(rec.get("task")),
+        "final_preview": _preview(rec.get("final")),
+        "latency_ms": rec.get("latency_ms"),
+        "ttft_ms": rec.get("ttft_ms"),
+        "blocked": _is_blocked(rec.get("trace")),
+        "retried": bool(rec.get("retried", False)),
+        "answer_cache": rec.get("answer_cache"),
+        "node_ms": rec.get("node_ms") or {},
+    }
+
+
+def _parse_lines(data: bytes, path: str, start: int):
+    """Summary rows for the complete lines in data (read from path at byte start); returns (rows, end)."""
+    data = data[:data.rfind(b"\n") + 1]
     rows = []
-    with open(log_file, "r", encoding="utf-8") as f:
-        for i, line in enumerate(f):
-            line = line.strip()
-            if not line:
+    pos = start
+    for raw in data.splitlines(keepends=True):
+        line = raw.strip()
+        if line:
+            try:
+                rows.append(_summarize(json.loads(line), path, pos, len(raw)))
+            except ValueError:
+                pass
+        pos += len(raw)
+    return rows, pos
+
+
+def _frame(rows) -> pd.DataFrame:
+    df = pd.DataFrame(rows)
+    if not df.empty:
+        df["timestamp_utc"] = pd.to_datetime(df["timestamp_utc"], errors="coerce", utc=True)
+    return df
+
+
+class RunLog:
+    """
+    Summary rows of the run log. Rotated runs-*.jsonl[.gz] archives are
+    parsed once each (they never change); the active runs.jsonl is loaded
+    incrementally, parsing only the lines appended since the last byte
+    offset. Full records are re-read by file and offset when a run is
+    inspected.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.log_dir = os.path.dirname(path)
+        self._lock = threading.Lock()
+        self._archives = {}  # archive path -> summary rows
+        self._archive_df = pd.DataFrame()
+        self._reset(None)
+        self.df = pd.DataFrame()
+
+    def _reset(self, inode):
+        self.inode = inode
+        self.offset = 0
+        self.head = b""  # first bytes of the file, to spot a new file that reuses the inode
+        self.active = pd.DataFrame()
+
+    def _replaced(self, st_) -> bool:
+        if st_.st_ino != self.inode or st_.st_size < self.offset:
+            return True
+        if not self.head:
+            return False
+        with open(self.path, "rb") as f:
+            return f.read(len(self.head)) != self.head
+
+    def _archive_paths(self):
+        plain = glob.glob(os.path.join(self.log_dir, "runs-*.jsonl"))
+        # While an archive is being compressed both copies exist; the plain one is complete
+        gz = [p for p in glob.glob(os.path.join(self.log_dir, "runs-*.jsonl.gz")) if p[:-3] not in plain]
+        mtimes = {}
+        for p in plain + gz:
+            try:
+                mtimes[p] = os.path.getmtime(p)
+            except FileNotFoundError:
+                pass
+        return sorted(mtimes, key=lambda p: (mtimes[p], p))
+
+    def _refresh_archives(self) -> bool:
+        paths = self._archive_paths()
+        if paths == list(self._archives):
+            return False
+        archives = {}
+        for p in paths:
+            if p in self._archives:
+                archives[p] = self._archives[p]
                 continue
-            rec = json.loads(line)
-            rec["_row_id"] = i 
-            rows.append(rec)
+            try:
+                opener = gzip.open if p.endswith(".gz") else open
+                with opener(p, "rb") as f:
+                    archives[p] = _parse_lines(f.read(), p, 0)[0]
+            except (FileNotFoundError, EOFError, OSError):
+                continue  # renamed or compressed meanwhile; picked up next refresh
+        self._archives = archives
+        self._archive_df = _frame([row for rows in archives.values() for row in rows])
+        return True
+
+    def _refresh_active(self) -> bool:
+        try:
+            st_ = os.stat(self.path)
+        except FileNotFoundError:
+            # Rotated away and nothing written since
+            changed = self.inode is not None
+            self._reset(None)
+            return changed
+
+        # Rotated, replaced or truncated: start over (the old lines are in an archive now)
+        changed = False
+        if self._replaced(st_):
+            self._reset(st_.st_ino)
+            changed = True
+
+        if st_.st_size == self.offset:
+            return changed
+
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(st_.st_size - self.offset)
+        if not self.head:
+            self.head = data[:64]
+
+        # Only complete lines; a line still being written is picked up next time
+        rows, self.offset = _parse_lines(data, self.path, self.offset)
+        if rows:
+            new = _frame(rows)
+            self.active = new if self.active.empty else pd.concat([self.active, new], ignore_index=True)
+            changed = True
+        return changed
+
+    def refresh(self) -> pd.DataFrame:
+        with self._lock:
+            archives_changed = self._refresh_archives()
+            active_changed = self._refresh_active()
+            if archives_changed or active_changed:
+                parts = [df for df in (self._archive_df, self.active) if not df.empty]
+                df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+                if not df.empty:
+                    df["_row_id"] = range(len(df))
+                self.df = df
+            return self.df
+
+    def load_record(self, row):
+        """Full record of a summary row, or None if its bytes now belong to another run (log rotated)."""
+        opener = gzip.open if row["_file"].endswith(".gz") else open
+        try:
+            with opener(row["_file"], "rb") as f:
+                f.seek(int(row["_offset"]))
+                rec = json.loads(f.read(int(row["_length"])))
+        except (FileNotFoundError, ValueError):
+            return None
+        ts = pd.to_datetime(rec.get("timestamp_utc"), errors="coerce", utc=True)
+        same_ts = (pd.isna(ts) and pd.isna(row["timestamp_utc"])) or ts == row["timestamp_utc"]
+        if not same_ts or _preview(rec.get("task")) != row["task_preview"]:
+            return None
+        return rec
+
+
+@st.cache_resource
+def _run_log(path: str) -> RunLog:
+    # One incremental reader per log file, shared across reruns and sessions
+    return RunLog(path)
+
+
+TIME_RANGES = {"Last 24 hours": 1, "Last 7 days": 7, "Last 30 days": 30, "All time": None}
+
+
+@st.cache_resource
+def _run_store(path: str):
+    # The dashboard only reads; the log writer owns the store
+    return RunStore(path, readonly=True)
+
+
+def _render_kpis(total, blocked_rate, retry_rate, avg_latency_ms):
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Total runs", total)
+    c2.metric("Blocked rate", f"{blocked_rate * 100:.1f}%")
+    c3.metric("Retry rate", f"{retry_rate * 100:.1f}%")
+    if avg_latency_ms is not None and not pd.isna(avg_latency_ms):
+        c4.metric("Average Latency", f"{avg_latency_ms:.0f} ms")
+    else:
+        c4.metric("Average Latency", "—")
 
-    df = pd.DataFrame(rows)
 
+def _render_runs_per_day(per_day: pd.Series):
+    st.markdown("### Runs over time")
+    if len(per_day):
+        st.line_chart(per_day)
+    else:
+        st.info("No timestamps found in logs yet.")
 
-    if "timestamp_utc" in df.columns:
-        df["timestamp_utc"] = pd.to_datetime(df["timestamp_utc"], errors="coerce")
 
-    if "trace" in df.columns:
-        df["blocked"] = df["trace"].apply(_is_blocked)
-    else:
-        df["blocked"] = False
+def _render_node_breakdown(breakdown: pd.DataFrame):
+    # Per-node latency (node_ms is summed over retries within a run)
+    st.markdown("### Latency by node")
+    if breakdown.empty:
+        st.info("No per-node timings logged yet.")
+        return
+    breakdown = breakdown.round(1).sort_values("mean_ms", ascending=False)
+    b1, b2 = st.columns(2)
+    b1.bar_chart(breakdown["mean_ms"])
+    b2.dataframe(breakdown, use_container_width=True)
+    st.caption("verifier includes query_rewriter time on retried runs.")
 
-    if "retried" not in df.columns:
-        df["retried"] = False
 
-    # KPIs
-    c1, c2, c3, c4 = st.columns(4)
-    c1.metric("Total runs", len(df))
-    c2.metric("Blocked rate", f"{df['blocked'].mean() * 100:.1f}%")
-    c3.metric("Retry rate", f"{df['retried'].mean() * 100:.1f}%")
+def _render_summary_table(table: pd.DataFrame):
+    st.markdown("### Runs (summary)")
+    table = table.copy()
+    table["latency_ms"] = pd.to_numeric(table["latency_ms"], errors="coerce").round(0)
+    cols = ["timestamp_utc", "latency_ms", "task_preview", "blocked", "retried", "final_preview"]
+    st.dataframe(table[cols], use_container_width=True, hide_index=True)
 
-    lat = pd.to_numeric(df.get("latency_ms", pd.Series(dtype="float64")), errors="coerce")
-    if lat.notna().any():
-        c4.metric("Average Latency", f"{lat.mean():.0f} ms")
-    else:
-        c4.metric("Average Latency", "—")
 
+def _pick_run(table: pd.DataFrame):
+    """Selectbox over the summary table; returns the selected row."""
+    table_reset = table.reset_index(drop=True)
+    labels = (
+        table_reset.index.astype(str) + " | "
+        + table_reset["timestamp_utc"].astype(str) + " | "
+        + table_reset["task_preview"].str.slice(0, 40)
+    ).tolist()
+    pick = st.selectbox("Select a run", labels, index=0)
+    return table_reset.iloc[int(pick.split(" | ")[0])]
 
-    st.divider()
 
-    # Runs over time
-    st.markdown("### Runs over time")
-    if "timestamp_utc" in df.columns and df["timestamp_utc"].notna().any():
-        tmp = df.dropna(subset=["timestamp_utc"]).copy()
-        tmp["day"] = tmp["timestamp_utc"].dt.date
-        st.line_chart(tmp.groupby("day").size())
-    else:
-        st.info("No timestamps found in logs yet.")
+def render_dashboard(ROOT_DIR: str):
+    st.subheader("Observability")
 
-    st.divider()
+    days = TIME_RANGES[st.selectbox("Time range", list(TIME_RANGES), index=len(TIME_RANGES) - 1)]
+    since = time.time() - days * 86400 if days else None
 
-    # Summary table (latest first)
-    st.markdown("### Runs (summary)")
-    table = df.copy()
+    store_path = os.path.join(ROOT_DIR, "logs", "runs.sqlite")
+    if run_store_enabled() and os.path.exists(store_path):
+        _render_from_store(_run_store(store_path), since)
+        return
 
-    if "task" in table.columns:
-        table["task_preview"] = table["task"].astype(str).str.replace("\n", " ").str.slice(0, 80)
-    else:
-        table["task_preview"] = ""
+    # Also covers a log that was just rotated and has no active file yet
+    run_log = _run_log(os.path.join(ROOT_DIR, "logs", "runs.jsonl"))
+    df = run_log.refresh()
+    if df.empty:
+        st.info("No runs logged yet. Ask a few questions first.")
+        return
+    if since is not None:
+        df = df[df["timestamp_utc"] >= pd.Timestamp(since, unit="s", tz="UTC")]
+    if df.empty:
+        st.info("No runs logged in this time range.")
+        return
 
-    if "final" in table.columns:
-        table["final_preview"] = table["final"].astype(str).str.replace("\n", " ").str.slice(0, 80)
-    else:
-        table["final_preview"] = ""
+    lat = pd.to_numeric(df["latency_ms"], errors="coerce")
+    _render_kpis(len(df), df["blocked"].mean(), df["retried"].mean(), lat.mean() if lat.notna().any() else None)
 
-    if "timestamp_utc" in table.columns:
-        table = table.sort_values("timestamp_utc", ascending=False)
-    else:
-        table = table.sort_values("_row_id", ascending=False)
+    st.divider()
+    _render_runs_per_day(df.dropna(subset=["timestamp_utc"]).groupby(df["timestamp_utc"].dt.date).size())
 
-    if "latency_ms" in table.columns:
-        table["latency_ms"] = pd.to_numeric(table["latency_ms"], errors="coerce").round(0)
+    st.divider()
+    nodes = pd.DataFrame([d if isinstance(d, dict) else {} for d in df["node_ms"]])
+    breakdown = pd.DataFrame()
+    if not nodes.empty and nodes.notna().any().any():
+        breakdown = pd.DataFrame({
+            "runs": nodes.count(),
+            "mean_ms": nodes.mean(),
+            # Same nearest-rank p95 as the run store, so both sources agree
+            "p95_ms": nodes.apply(lambda col: nearest_rank_p95(col.dropna())),
+        })
+    _render_node_breakdown(breakdown)
 
-    cols = [c for c in ["timestamp_utc", "latency_ms", "task_preview", "blocked", "retried", "final_preview"] if c in table.columns]
-    st.dataframe(table[cols], use_container_width=True, hide_index=True)
+    st.divider()
+    table = df.sort_values(["timestamp_utc", "_row_id"], ascending=False)
+    _render_summary_table(table)
 
     st.divider()
 
     # Inspect a run (trace + sources)
     st.markdown("### Inspect a run")
+    selected = _pick_run(table)
 
-    table_reset = table.reset_index(drop=True)
-    labels = []
-    for i, r in table_reset.iterrows():
-        ts = r.get("timestamp_utc", "")
-        taskp = str(r.get("task_preview", ""))[:40]
-        labels.append(f"{i} | {ts} | {taskp}")
-
-    if not labels:
-        st.info("No runs to inspect yet.")
+    # Only the selected run's full record (trace, notes, spans) is parsed
+    record = run_log.load_record(selected)
+    if record is None:
+        st.info("The log was rotated while this page was open; reload to inspect this run.")
         return
+    _render_run(record)
 
-    pick = st.selectbox("Select a run", labels, index=0)
-    idx = int(pick.split(" | ")[0])
-    selected_row_id = int(table_reset.iloc[idx]["_row_id"])
 
-    full_rec = df[df["_row_id"] == selected_row_id].iloc[0]
+def _render_from_store(store, since):
+    """Same views as the JSONL path, served by indexed aggregate queries."""
+    k = store.kpis(since)
+    if not k["total"]:
+        st.info("No runs logged in this time range.")
+        return
+    _render_kpis(k["total"], k["blocked_rate"], k["retry_rate"], k["avg_latency_ms"])
+    st.caption(f"No-evidence rate: {k['no_evidence_rate'] * 100:.1f}%")
+
+    st.divider()
+    per_day = store.runs_per_day(since)
+    _render_runs_per_day(pd.Series(dict(per_day), dtype="int64"))
+
+    st.divider()
+    nodes = store.node_latency(since)
+    _render_node_breakdown(pd.DataFrame(nodes).set_index("node") if nodes else pd.DataFrame())
+
+    st.divider()
+    table = pd.DataFrame(store.recent(since, limit=500))
+    table["task_preview"] = table["task"].map(_preview)
+    table["final_preview"] = table["final_preview"].map(_preview)
+    table["blocked"] = table["blocked"].astype(bool)
+    table["retried"] = table["retried"].astype(bool)
+    _render_summary_table(table)
+    st.caption("Latest 500 runs in the selected range.")
 
+    st.divider()
+    st.markdown("### Inspect a run")
+    selected = _pick_run(table)
+    _render_run(store.details(int(selected["id"])))
+
+
+def _render_run(full_rec: dict):
     cA, cB = st.columns(2)
 
     with cA:
+        spans = full_rec.get("spans")
+        if isinstance(spans, list) and spans:
+            st.markdown("**Timing**")
+            st.dataframe(
+                pd.DataFrame(spans),
+                use_container_width=True,
+                hide_index=True,
+            )
+
         st.markdown("**Trace**")
         st.json(full_rec.get("trace", []))
 
@@ -143,6 +379,7 @@ def render_dashboard(ROOT_DIR: str):
                     "page": c.get("page", ""),
                     "chunk": c.get("chunk_in_page", ""),
                     "score": n.get("score"),
+                    "rerank": n.get("rerank_score"),
                 })
 
         if sources:
@@ -154,7 +391,8 @@ def render_dashboard(ROOT_DIR: str):
                     .str.split("\\").str[-1]
                 )
             st.dataframe(
-                src_df[[c for c in ["n", "file", "page", "chunk", "score"] if c in src_df.columns]],
+                src_df[[c for c in ["n", "file", "page", "chunk", "score", "rerank"]
+                        if c in src_df.columns and src_df[c].notna().any()]],
                 use_container_width=True,
                 hide_index=True
             )
@@ -11,10 +11,20 @@ import pandas as pd
 import streamlit as st
 
 from dashboard import render_dashboard
-from agents.graph import run as run_graph
+from agents.graph import run_stream, warm_up
+from agents.persistence import flush as flush_run_log
 
 st.set_page_config(page_title="Tringa's Multi-Agent Chatbot", page_icon="🛒", layout="wide")
 
+
+@st.cache_resource
+def _warm_up():
+    # Runs once per server process, not on every rerun
+    return warm_up()
+
+
+_warm_up()
+
 st.markdown(
     """
     <style>
@@ -106,8 +116,21 @@ with tab_chat:
             st.markdown(question)
 
         with st.chat_message("assistant"):
-            with st.spinner("Running agents..."):
-                state = run_graph(task=question, top_k=top_k)
+            # Writer tokens are shown as they arrive; the verified answer replaces them below
+            placeholder = st.empty()
+            placeholder.caption("Running agents...")
+            streamed = ""
+            state = {}
+            for event in run_stream(task=question, top_k=top_k):
+                if event["type"] == "token":
+                    streamed += event["text"]
+                    placeholder.markdown(streamed + "▌")
+                elif event["type"] == "retry":
+                    streamed = ""
+                    placeholder.caption("Citations incomplete; retrying with a rewritten query...")
+                elif event["type"] == "final":
+                    state = event["state"]
+            placeholder.empty()
 
             final = (state.get("final") or state.get("draft") or "").strip()
             trace = state.get("trace", []) or []
@@ -162,4 +185,6 @@ with tab_chat:
 
 # --- Dashboard tab ---
 with tab_dashboard:
+    # Runs are logged by a background writer; include the one just answered
+    flush_run_log()
     render_dashboard(ROOT_DIR)
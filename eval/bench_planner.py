@@ -0,0 +1,129 @@
+import argparse
+import random
+import re
+import sys
+import time
+
+from agents.planner_agent import DIRECT_REQUEST_KEYWORDS, route
+
+
+# ---------------------------------------------------------------------
+# Previous planner routing, kept verbatim as the reference
+# ---------------------------------------------------------------------
+
+def _contains(task: str, *words) -> bool:
+    return any(re.search(rf"\b{w}\b", task, re.I) for w in words)
+
+
+def legacy_route(task: str):
+    if _contains(task, "hi", "hello", "hey", "yo", "sup", "thanks", "thank you"):
+        sections = ["Not found in the sources."]
+    elif _contains(task, "top", "best", "rank", "ranking", "highest", "lowest") or re.search(r"\btop\s*\d+\b", task):
+        sections = ["Top results (ranked, with citations)", "Evidence per item (1–2 lines)"]
+    elif _contains(task, "list", "show", "give", "provide", "tell me", "tell us") or task.strip().endswith(":"):
+        sections = ["List of items (with citations)"]
+    elif _contains(task, "why", "reason", "rationale"):
+        sections = ["Direct answer (with citations)", "Key reasons (with citations)", "Implications / what it means"]
+    elif _contains(task, "how", "steps", "process", "approach", "implement"):
+        sections = ["Direct answer (with citations)", "Steps / approach (with citations)", "Pitfalls / caveats (with citations)"]
+    elif _contains(task, "where", "used", "applied", "application", "use case", "use-case"):
+        sections = ["Direct answer (with citations)", "Where it applies (grouped by category/stage)", "Examples (with citations)"]
+    elif _contains(task, "compare", "difference", "vs"):
+        sections = ["Comparison summary (with citations)", "Key differences (with citations)", "Implications"]
+    elif _contains(task, "risk", "mitigat", "threat", "challenge", "issue", "problem"):
+        sections = ["Main risks / issues (with citations)", "Mitigations (with citations)", "Practical advice"]
+    elif _contains(task, "define", "what is", "explain", "meaning"):
+        sections = ["Explanation (with citations)", "Examples (with citations)", "Limitations"]
+    else:
+        sections = ["Direct answer (with citations)", "Key points (with citations)", "Recommendations (if supported by sources)"]
+
+    if _contains(task, "email", "draft", "message"):
+        sections = ["Email draft (grounded in sources)"]
+
+    is_direct_request = _contains(
+        task,
+        "list", "show", "give", "tell", "top", "rank",
+        "why", "how", "compare", "difference", "vs",
+        "define", "what is", "explain"
+    )
+    return sections, is_direct_request
+
+
+# ---------------------------------------------------------------------
+# Synthetic questions
+# ---------------------------------------------------------------------
+
+KEYWORDS = [
+    "hi", "hello", "hey", "yo", "sup", "thanks", "thank you",
+    "top", "best", "rank", "ranking", "highest", "lowest",
+    "list", "show", "give", "provide", "tell me", "tell us", "tell",
+    "why", "reason", "rationale",
+    "how", "steps", "process", "approach", "implement",
+    "where", "used", "applied", "application", "use case", "use-case",
+    "compare", "difference", "vs",
+    "risk", "mitigat", "threat", "challenge", "issue", "problem",
+    "define", "what is", "explain", "meaning",
+    "email", "draft", "message",
+]
+
+# Near misses that must not change the route (substrings, other separators, digits, unicode case)
+DISTRACTORS = [
+    "history", "shows", "showing", "mitigation", "risks", "stop", "laptop", "top5", "top 10", "top10x",
+    "top_5", "top\t3", "hi5", "this", "whyever", "howl", "thank  you", "thank-you", "use  case", "use_case",
+    "what's", "whatis", "vs.", "e-mail", "messages", "ſhow", "ıssue", "HELLO", "KelvinK", "hİ", "top٣",
+    "cold chain", "iot", "sensors", "temperature", "food safety", "traceability", "blockchain", "supply",
+]
+
+FILLER = ["the", "of", "in", "for", "a", "and", "to", "with", "our", "iot", "data", "logistics", "warehouse"]
+PUNCT = ["", "", "?", ".", "!", ":", " :", ",", "..."]
+
+
+def synthetic_questions(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    pool = KEYWORDS + DISTRACTORS
+    out = []
+    for _ in range(n):
+        words = [rnd.choice(FILLER) for _ in range(rnd.randint(0, 12))]
+        for _ in range(rnd.randint(0, 3)):
+            words.insert(rnd.randint(0, len(words)), rnd.choice(pool))
+        sep = rnd.choice([" ", " ", " ", "  ", "\n", " - "])
+        text = sep.join(words) + rnd.choice(PUNCT)
+        if rnd.random() < 0.2:
+            text = text.upper()
+        out.append(text.strip())
+    return out
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Check the planner routing table against the previous regex routing.")
+    parser.add_argument("-n", type=int, default=100_000, help="Number of synthetic questions")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    tasks = [q.strip().lower() for q in synthetic_questions(args.n, args.seed)]
+
+    t0 = time.perf_counter()
+    expected = [legacy_route(t) for t in tasks]
+    legacy_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    got = [route(t) for t in tasks]
+    table_s = time.perf_counter() - t0
+
+    mismatches = []
+    for task, (sections, direct), (_, new_sections, features) in zip(tasks, expected, got):
+        if sections != new_sections or direct != (not features.isdisjoint(DIRECT_REQUEST_KEYWORDS)):
+            mismatches.append((task, sections, new_sections))
+
+    print(f"{len(tasks)} questions")
+    print(f"regex routing: {legacy_s * 1e6 / len(tasks):.1f} us/question")
+    print(f"routing table: {table_s * 1e6 / len(tasks):.1f} us/question ({legacy_s / table_s:.1f}x faster)")
+    print(f"mismatched routes: {len(mismatches)}")
+    for task, old, new in mismatches[:10]:
+        print(f"  {task!r}\n    regex: {old}\n    table: {new}")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,18 @@ import os
 os.environ["EVAL_MODE"] = "1"
 
 
+import argparse
 import json
 import re
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any, Dict, List, Tuple
 from datetime import datetime
 
-from agents.graph import run as run_graph
+from agents.graph import run as run_graph, warm_up
+from agents.rag_retrieve import DEFAULT_RETRIEVAL_MODE, RETRIEVAL_MODES
 
 
 def normalize(s: str) -> str:
@@ -123,14 +127,193 @@ def run_one(case: Dict[str, Any]) -> Tuple[bool, List[str], Dict[str, Any]]:
     passed = len(errors) == 0
     details = {
         "stop": stop,
+        "retried": bool(state.get("retried")),
         "latency_ms": state.get("latency_ms"),
+        "node_ms": state.get("node_ms") or {},
         "final_preview": final[:900],
     }
     return passed, errors, details
 
 
 
-def main() -> None:
+# ---------------------------------------------------------------------
+# Benchmark mode (--repeat N)
+# ---------------------------------------------------------------------
+
+# Runtime output goes next to the run log, not into the eval sources
+BENCH_HISTORY_PATH = Path(__file__).parent.parent / "logs" / "bench_history.jsonl"
+BENCH_BASELINE_PATH = Path(__file__).parent / "bench_baseline.json"
+
+# Percentiles compared against the baseline; p99 is recorded but too noisy to gate on
+GATED_STATS = ("p50", "p95")
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Linear-interpolated percentile (q in 0..100)."""
+    xs = sorted(values)
+    if not xs:
+        return 0.0
+    pos = (len(xs) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (pos - lo)
+
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    return {
+        "n": len(values),
+        "mean": round(sum(values) / len(values), 2) if values else 0.0,
+        "p50": round(percentile(values, 50), 2),
+        "p95": round(percentile(values, 95), 2),
+        "p99": round(percentile(values, 99), 2),
+    }
+
+
+def summarize_samples(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """samples: run_one() details dicts -> e2e and per-node latency summaries."""
+    e2e = [d["latency_ms"] for d in samples if d.get("latency_ms") is not None]
+    per_node: Dict[str, List[float]] = {}
+    for d in samples:
+        for node, ms in (d.get("node_ms") or {}).items():
+            per_node.setdefault(node, []).append(ms)
+    return {
+        "e2e": latency_summary(e2e),
+        "nodes": {node: latency_summary(v) for node, v in sorted(per_node.items())},
+    }
+
+
+def compare_to_baseline(summary: Dict[str, Any], baseline: Dict[str, Any],
+                        threshold: float, min_delta_ms: float) -> List[str]:
+    """Return one message per gated statistic that regressed beyond threshold."""
+    pairs = [("e2e", summary["e2e"], baseline.get("e2e") or {})]
+    for node, stats in summary["nodes"].items():
+        pairs.append((f"node:{node}", stats, (baseline.get("nodes") or {}).get(node) or {}))
+
+    regressions = []
+    for name, cur, base in pairs:
+        for stat in GATED_STATS:
+            if stat not in base:
+                continue
+            delta = cur[stat] - base[stat]
+            # Sub-millisecond nodes would otherwise flag on scheduler noise
+            if delta > min_delta_ms and cur[stat] > base[stat] * (1 + threshold):
+                regressions.append(
+                    f"{name} {stat}: {base[stat]} -> {cur[stat]} ms (+{delta / base[stat] * 100 if base[stat] else float('inf'):.0f}%)"
+                )
+    return regressions
+
+
+def _print_summary(title: str, summary: Dict[str, Any]) -> None:
+    print(title)
+    rows = [("e2e", summary["e2e"])] + list(summary["nodes"].items())
+    for name, st in rows:
+        print(f"  {name:<14} p50={st['p50']:>9} p95={st['p95']:>9} p99={st['p99']:>9} ms  (n={st['n']})")
+
+
+def run_benchmark(cases: List[Dict[str, Any]], args) -> int:
+    if not args.keep_llm_cache:
+        # Repeated identical prompts would otherwise measure the completion cache
+        os.environ["LLM_CACHE"] = "0"
+
+    # Interleave repeats so slow drift (network, thermal) spreads over all cases
+    schedule = [case for _ in range(args.repeat) for case in cases]
+    print(f"Benchmark: {len(cases)} cases x {args.repeat} runs (jobs={args.jobs})...\n")
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        outcomes = list(pool.map(run_one, schedule))
+    wall_ms = round((time.perf_counter() - t0) * 1000, 2)
+
+    by_case: Dict[str, List[Dict[str, Any]]] = {}
+    passed_runs = 0
+    for case, (ok, _errors, details) in zip(schedule, outcomes):
+        by_case.setdefault(case.get("id", "(no id)"), []).append(details)
+        passed_runs += ok
+
+    samples = [details for _, _, details in outcomes]
+    summary = summarize_samples(samples)
+    record = {
+        "timestamp_utc": datetime.utcnow().isoformat(),
+        "repeat": args.repeat,
+        "jobs": args.jobs,
+        "llm_cache": os.getenv("LLM_CACHE", "1") == "1",
+        "retrieval_mode": os.getenv("RETRIEVAL_MODE", DEFAULT_RETRIEVAL_MODE),
+        "wall_ms": wall_ms,
+        "runs": len(schedule),
+        "passed_runs": passed_runs,
+        "retried_runs": sum(d["retried"] for d in samples),
+        **summary,
+        "cases": {cid: summarize_samples(d)["e2e"] for cid, d in by_case.items()},
+    }
+
+    _print_summary("Latency (all cases):", summary)
+    print(f"\nPassed runs: {passed_runs}/{len(schedule)} | retried: {record['retried_runs']} | wall time: {wall_ms} ms")
+
+    BENCH_HISTORY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(BENCH_HISTORY_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+    print(f"History appended to {BENCH_HISTORY_PATH}")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(record, indent=2), encoding="utf-8")
+        print(f"Baseline saved to {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print(f"No baseline at {baseline_path}; run with --save-baseline to create one.")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    regressions = compare_to_baseline(summary, baseline, args.threshold, args.min_delta_ms)
+    print(f"\nBaseline from {baseline.get('timestamp_utc')} (threshold +{args.threshold * 100:.0f}%):")
+    if regressions:
+        for r in regressions:
+            print(f"  REGRESSION  {r}")
+        return 1
+    print("  no latency regressions")
+    return 0
+
+
+def _print_case(case_id: str, ok: bool, errors: List[str], details: Dict[str, Any]) -> None:
+    if ok:
+        print(f"PASS  {case_id}  |  latency={details.get('latency_ms')} ms")
+    else:
+        print(f"FAIL  {case_id}")
+        for e in errors:
+            print(f"  - {e}")
+        print(f"  stop={details['stop']} latency_ms={details['latency_ms']}")
+        print(f"  final:\n{details['final_preview']}\n")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the evaluation cases in questions.json.")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of cases to run concurrently (default: 1, sequential)")
+    parser.add_argument("--repeat", type=int, default=0,
+                        help="Benchmark mode: run each case N times and report p50/p95/p99 latency")
+    parser.add_argument("--baseline", default=str(BENCH_BASELINE_PATH),
+                        help="Baseline file to compare the benchmark against")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Store this benchmark as the new baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed relative latency increase before failing (default: 0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0,
+                        help="Ignore regressions smaller than this many ms (default: 5)")
+    parser.add_argument("--keep-llm-cache", action="store_true",
+                        help="Benchmark with the completion cache enabled")
+    parser.add_argument("--retrieval-mode", choices=RETRIEVAL_MODES,
+                        help="Override RETRIEVAL_MODE (dense, sparse or hybrid) for this run")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    jobs = max(1, args.jobs)
+    if args.retrieval_mode:
+        os.environ["RETRIEVAL_MODE"] = args.retrieval_mode
+    mode = os.getenv("RETRIEVAL_MODE", DEFAULT_RETRIEVAL_MODE)
+
     questions_path = Path(__file__).parent / "questions.json"
     if not questions_path.exists():
         print(f"ERROR: questions.json not found at {questions_path}")
@@ -145,37 +328,52 @@ def main() -> None:
     passed_n = 0
     results_cases = []
 
-    print(f"Running {total} evaluation cases from questions.json...\n")
-
-    for case in cases:
-        case_id = case.get("id", "(no id)")
-        ok, errors, details = run_one(case)
-
-        if ok:
-            passed_n += 1
-            print(f"PASS  {case_id}  |  latency={details.get('latency_ms')} ms")
-        else:
-            print(f"FAIL  {case_id}")
-            for e in errors:
-                print(f"  - {e}")
-            print(f"  stop={details['stop']} latency_ms={details['latency_ms']}")
-            print(f"  final:\n{details['final_preview']}\n")
-
-        results_cases.append({
-            "id": case_id,
-            "passed": ok,
-            "errors": errors,
-            "stop": details["stop"],
-            "latency_ms": details.get("latency_ms")
-        })
+    warm = warm_up()
+    print(f"Warm-up: graph={warm['graph_compile_ms']} ms, index={warm['index_load_ms']} ms")
+
+    if args.repeat > 0:
+        sys.exit(run_benchmark(cases, args))
+
+    print(f"Running {total} evaluation cases from questions.json (jobs={jobs}, retrieval={mode})...\n")
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        # map() yields in case order, so output and results.json do not depend on scheduling
+        for case, (ok, errors, details) in zip(cases, pool.map(run_one, cases)):
+            case_id = case.get("id", "(no id)")
+            if ok:
+                passed_n += 1
+            _print_case(case_id, ok, errors, details)
+
+            results_cases.append({
+                "id": case_id,
+                "passed": ok,
+                "errors": errors,
+                "stop": details["stop"],
+                "retried": details["retried"],
+                "latency_ms": details.get("latency_ms")
+            })
+    wall_ms = round((time.perf_counter() - t0) * 1000, 2)
+    sum_latency_ms = round(sum(c["latency_ms"] or 0 for c in results_cases), 2)
+    retried_n = sum(c["retried"] for c in results_cases)
 
     print(f"\nResult: {passed_n}/{total} passed")
+    print(f"Retry rate: {retried_n}/{total} ({retried_n / total * 100:.0f}%) with retrieval={mode}")
+    print(
+        f"Wall time: {wall_ms} ms | summed case latency: {sum_latency_ms} ms"
+        f" | speedup: {sum_latency_ms / wall_ms if wall_ms else 0:.2f}x"
+    )
 
     results = {
         "timestamp_utc": datetime.utcnow().isoformat(),
         "total": total,
         "passed": passed_n,
         "failed": total - passed_n,
+        "jobs": jobs,
+        "retrieval_mode": mode,
+        "retried": retried_n,
+        "wall_ms": wall_ms,
+        "sum_latency_ms": sum_latency_ms,
         "cases": results_cases
     }
 